@@ -0,0 +1,24 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Scorecard benchmark: seeds a synthetic DeployHub dm schema into a Postgres database and drives each
+get_scorecard mode through the ASGI app in-process, reporting latency percentiles, throughput and peak RSS,
+plus the cold start (import and lifespan startup) of main in a fresh interpreter.
+
+    python -m benchmark seed --apps 50 --components 20 --envs 5 --deployments 40
+    python -m benchmark run --modes default,frequency,lag --requests 200 --concurrency 8
+
+Runs are appended to benchmark/results/history.jsonl and compared with the last run at the same scale and settings.
+"""
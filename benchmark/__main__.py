@@ -0,0 +1,87 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+from benchmark import runner, schema
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Seed a synthetic scorecard database and benchmark the scorecard endpoints.")
+    parser.add_argument("--db-host", default=os.getenv("DB_HOST", "localhost"))
+    parser.add_argument("--db-port", default=os.getenv("DB_PORT", "5432"))
+    parser.add_argument("--db-user", default=os.getenv("DB_USER", "postgres"))
+    parser.add_argument("--db-pass", default=os.getenv("DB_PASS", "postgres"))
+    parser.add_argument("--db-name", default="scorecard_bench", help="benchmark database, created if missing (default: scorecard_bench)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seedcmd = commands.add_parser("seed", help="(re)create the dm schema with synthetic data")
+    seedcmd.add_argument("--apps", type=int, default=50, help="base applications")
+    seedcmd.add_argument("--versions", type=int, default=3, help="versions per base application")
+    seedcmd.add_argument("--components", type=int, default=20, help="components per application")
+    seedcmd.add_argument("--envs", type=int, default=5, help="environments")
+    seedcmd.add_argument("--deployments", type=int, default=40, help="deployments per application version")
+    seedcmd.add_argument("--seed", type=int, default=7, help="random seed")
+
+    runcmd = commands.add_parser("run", help="drive the scorecard endpoints and record the results")
+    runcmd.add_argument("--modes", default=",".join(runner.MODES), help="comma separated: " + ", ".join(runner.MODES))
+    runcmd.add_argument("--requests", type=int, default=200, help="requests per mode")
+    runcmd.add_argument("--concurrency", type=int, default=8)
+    runcmd.add_argument("--warmup", type=int, default=10, help="untimed requests per mode")
+    runcmd.add_argument("--compute", choices=["pandas", "sql"], default="pandas")
+    runcmd.add_argument("--format", choices=["json", "compact", "ndjson", "arrow", "parquet"], default="json")
+    runcmd.add_argument("--batch-size", type=int, default=10, help="items per batch request")
+    runcmd.add_argument("--cache", action="store_true", help="leave the response cache on")
+    runcmd.add_argument("--results", type=Path, default=runner.RESULTS_FILE, help="history file runs are appended to")
+    runcmd.add_argument("--threshold", type=float, default=0.2, help="p95 growth over the previous matching run reported as a regression")
+    runcmd.add_argument("--fail-on-regression", action="store_true", help="exit 1 when a mode regressed")
+
+    args = parser.parse_args(argv)
+    db = (args.db_host, args.db_port, args.db_user, args.db_pass, args.db_name)
+
+    if args.command == "seed":
+        scale = schema.Scale(apps=args.apps, versions=args.versions, components=args.components, envs=args.envs, deployments=args.deployments)
+        counts = schema.seed(*db, scale, args.seed)
+        for table, count in counts.items():
+            print(f"{table:28} {count:>10}")
+        return 0
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in modes if mode not in runner.MODES]
+    if unknown:
+        parser.error("unknown mode(s): " + ", ".join(unknown))
+
+    record = runner.run(*db, modes, args.requests, args.concurrency, args.warmup, args.compute, args.format, args.batch_size, args.cache)
+    history = runner.load_history(args.results)
+    regressions = runner.compare(record, history, args.threshold)
+    runner.save_record(args.results, record)
+
+    print(f"{'mode':10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'errors':>7} {'bytes':>9} {'peak MB':>8} {'+MB':>6}")
+    for mode, result in record["modes"].items():
+        print(
+            f"{mode:10} {result['p50_ms']:>9} {result['p95_ms']:>9} {result['p99_ms']:>9} {result['throughput_rps']:>8} {result['errors']:>7} {result['bytes_per_request']:>9} {result['peak_rss_mb']:>8} {result['rss_growth_mb']:>6}"
+        )
+    print("peak MB is the process-wide peak RSS so far, +MB how much the mode raised it")
+    print(f"startup: import {record['startup']['import_ms']} ms, ready {record['startup']['ready_ms']} ms")
+    for name, metric, before, after, revision in regressions:
+        print(f"REGRESSION {name}: {metric} {before} ms -> {after} ms (previous run {revision or 'unknown'})")
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
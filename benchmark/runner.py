@@ -0,0 +1,278 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Union
+
+import numpy as np  # pylint: disable=E0401
+import psycopg2  # pylint: disable=E0401
+
+RESULTS_FILE = Path(__file__).parent / "results" / "history.jsonl"
+
+MODES = ("default", "frequency", "lag", "batch")
+
+TABLES = ("dm_application", "dm_deployment", "dm_environment", "dm_component", "dm_applicationcomponent", "dm_scorecard_nv", "dm_app_scorecard")
+
+
+# Cold starts timed per run, the median is recorded
+STARTUP_RUNS = 3
+
+STARTUP_SCRIPT = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+
+async def start():
+    async with main.lifespan(main.app):
+        pass
+
+
+asyncio.run(start())
+print(json.dumps({"import_ms": (imported - started) * 1000, "ready_ms": (time.perf_counter() - started) * 1000}))
+"""
+
+
+def app_environ(host: str, port: str, user: str, password: str, dbname: str, cache: bool) -> dict:
+    env = {"DB_HOST": host, "DB_PORT": port, "DB_USER": user, "DB_PASS": password, "DB_NAME": dbname}
+    # Skip the reverse DNS lookup of the validate-user service
+    env["VALIDATEUSER_URL"] = os.getenv("VALIDATEUSER_URL", "http://localhost")
+    if not cache:
+        env["SCORECARD_CACHE_SIZE"] = "0"
+    return env
+
+
+def load_app(host: str, port: str, user: str, password: str, dbname: str, cache: bool):
+    """
+    Import main against the benchmark database. main reads its settings from the environment at import time.
+    """
+    os.environ.update(app_environ(host, port, user, password, dbname, cache))
+    import main  # pylint: disable=C0415
+
+    return main.app
+
+
+def measure_startup(host: str, port: str, user: str, password: str, dbname: str, cache: bool, runs: int = STARTUP_RUNS) -> dict:
+    """
+    Cold start of main in fresh interpreters: the import, then the lifespan startup (DNS, SCORECARD_WARMUP if set).
+    """
+    env = dict(os.environ, **app_environ(host, port, user, password, dbname, cache))
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], capture_output=True, text=True, check=True, cwd=Path(__file__).parent.parent, env=env).stdout
+        samples.append(json.loads(out.splitlines()[-1]))
+    return {key: round(float(np.median([sample[key] for sample in samples])), 1) for key in samples[0]}
+
+
+async def asgi_request(app, method: str, path: str, query: str = "", body: bytes = b"") -> tuple[int, int]:
+    """
+    Send one request straight into the ASGI app and return (status, response bytes).
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"benchmark"), (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    sent = False
+    finished = asyncio.Event()
+    result = {"status": 0, "nbytes": 0}
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            result["nbytes"] += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                finished.set()
+
+    await app(scope, receive, send)
+    finished.set()
+    return result["status"], result["nbytes"]
+
+
+def load_targets(host: str, port: str, user: str, password: str, dbname: str) -> tuple[list, list, dict]:
+    """
+    Application version ids, base application names and table row counts of the seeded database.
+    """
+    conn = psycopg2.connect(host=host, port=port, user=user, password=password, dbname=dbname)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("select id from dm.dm_application where parentid is not null order by id")
+        appids = [str(row[0]) for row in cursor.fetchall()]
+        cursor.execute("select name from dm.dm_application where parentid is null order by id")
+        appnames = [row[0] for row in cursor.fetchall()]
+        counts = {}
+        for table in TABLES:
+            cursor.execute("select count(*) from dm." + table)
+            counts[table] = cursor.fetchone()[0]
+    finally:
+        conn.close()
+    return appids, appnames, counts
+
+
+def mode_request(mode: str, index: int, appids: list, appnames: list, compute: str, format: str, batchsize: int) -> tuple[str, str, str, bytes]:
+    """
+    The (method, path, query, body) of the index-th request of a mode, walking round-robin over the applications.
+    """
+    appid = appids[index % len(appids)]
+    params = "compute=" + compute + "&format=" + format
+    if mode == "frequency":
+        return "GET", "/msapi/scorecard", "frequency=y&appid=" + appid + "&" + params, b""
+    if mode == "lag":
+        return "GET", "/msapi/scorecard", "lag=y&appname=" + appnames[index % len(appnames)] + "&" + params, b""
+    if mode == "batch":
+        items = [{"mode": "scorecard", "appid": appids[(index * batchsize + offset) % len(appids)]} for offset in range(batchsize)]
+        return "POST", "/msapi/scorecard/batch", "", json.dumps({"items": items, "compute": compute}).encode()
+    return "GET", "/msapi/scorecard", "appid=" + appid + "&" + params, b""
+
+
+def peak_rss_mb() -> float:
+    # Peak RSS of the whole process so far. ru_maxrss only ever grows, and is kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(maxrss / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+async def run_mode(app, mode: str, requests: int, concurrency: int, warmup: int, **kwargs) -> dict:
+    """
+    Fire requests for one mode from concurrency workers and summarise the latencies.
+
+    The modes share the process, so peak_rss_mb is the process-wide peak after this mode (earlier modes included) and
+    rss_growth_mb how far this mode raised it. A mode that stays under an earlier peak shows no growth.
+    """
+    startrss = peak_rss_mb()
+    for index in range(warmup):
+        await asgi_request(app, *mode_request(mode, index, **kwargs))
+
+    latencies: list[float] = []
+    errors = 0
+    nbytes = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors, nbytes
+        for index in counter:
+            start = time.perf_counter()
+            status, size = await asgi_request(app, *mode_request(mode, index, **kwargs))
+            latencies.append(time.perf_counter() - start)
+            nbytes += size
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000.0
+    peakrss = peak_rss_mb()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+        "throughput_rps": round(requests / elapsed, 1),
+        "bytes_per_request": int(nbytes / requests),
+        "peak_rss_mb": peakrss,
+        "rss_growth_mb": round(peakrss - startrss, 1),
+    }
+
+
+def git_revision() -> Union[str, None]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(host: str, port: str, user: str, password: str, dbname: str, modes: list, requests: int, concurrency: int, warmup: int, compute: str, format: str, batchsize: int, cache: bool) -> dict:
+    appids, appnames, counts = load_targets(host, port, user, password, dbname)
+    if not appids:
+        raise SystemExit("No applications in " + dbname + ", run python -m benchmark seed first")
+
+    startup = measure_startup(host, port, user, password, dbname, cache)
+    app = load_app(host, port, user, password, dbname, cache)
+    record = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "settings": {"dataset": counts, "compute": compute, "format": format, "concurrency": concurrency, "batchsize": batchsize, "cache": cache},
+        "startup": startup,
+        "modes": {},
+    }
+
+    async def run_modes():
+        for mode in modes:
+            record["modes"][mode] = await run_mode(app, mode, requests, concurrency, warmup, appids=appids, appnames=appnames, compute=compute, format=format, batchsize=batchsize)
+
+    asyncio.run(run_modes())
+    return record
+
+
+def load_history(path: Path) -> list:
+    if not path.exists():
+        return []
+    with path.open(encoding="utf-8") as history:
+        return [json.loads(line) for line in history if line.strip()]
+
+
+def save_record(path: Path, record: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as history:
+        history.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def compare(record: dict, history: list, threshold: float) -> list:
+    """
+    Modes whose p95, and a startup whose time to ready, grew by more than threshold (a fraction) over the last run with the same settings.
+    """
+    previous = next((old for old in reversed(history) if old.get("settings") == record["settings"]), None)
+    if previous is None:
+        return []
+
+    regressions = []
+    for mode, result in record["modes"].items():
+        before = previous["modes"].get(mode)
+        if before and before["p95_ms"] > 0 and result["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append((mode, "p95", before["p95_ms"], result["p95_ms"], previous.get("revision")))
+    before = previous.get("startup")
+    if before and before["ready_ms"] > 0 and record["startup"]["ready_ms"] > before["ready_ms"] * (1 + threshold):
+        regressions.append(("startup", "ready", before["ready_ms"], record["startup"]["ready_ms"], previous.get("revision")))
+    return regressions
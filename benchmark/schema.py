@@ -0,0 +1,167 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import random
+from collections import namedtuple
+
+import psycopg2  # pylint: disable=E0401
+
+# apps: base applications, versions: versions under each base, components: components per application,
+# envs: environments, deployments: deployments per application version
+Scale = namedtuple("Scale", ["apps", "versions", "components", "envs", "deployments"])
+
+SCHEMA = """
+    drop schema if exists dm cascade;
+    create schema dm;
+    create table dm.dm_env_order (id integer, envname varchar(256));
+    create table dm.dm_environment (id integer primary key, name varchar(256));
+    create table dm.dm_application (id integer primary key, name varchar(256), parentid integer, domainid integer, status char(1), created bigint);
+    create table dm.dm_deployment (deploymentid integer primary key, appid integer, envid integer, startts timestamp);
+    create table dm.dm_component (id integer primary key, name varchar(256), status char(1));
+    create table dm.dm_applicationcomponent (appid integer, compid integer);
+    create table dm.dm_scorecard_nv (id integer, name varchar(256), value varchar(256));
+    create table dm.dm_app_scorecard (parentid integer, application varchar(256), environment varchar(256), monthly timestamp);
+"""
+
+INDEXES = """
+    create index on dm.dm_application (parentid);
+    create index on dm.dm_deployment (appid);
+    create index on dm.dm_applicationcomponent (appid);
+    create index on dm.dm_applicationcomponent (compid);
+    create index on dm.dm_scorecard_nv (id);
+    create index on dm.dm_app_scorecard (parentid);
+    analyze;
+"""
+
+
+def nv_rows(rnd: random.Random, compid: int) -> list:
+    """
+    The name/value pairs a component picks up from its build: sonar, veracode, git stats and repo flags.
+    """
+    rows = [
+        (compid, "SonarBugs", str(rnd.randint(0, 20))),
+        (compid, "SonarCodeSmells", str(rnd.randint(0, 200))),
+        (compid, "SonarViolations", str(rnd.randint(0, 50))),
+        (compid, "SonarProjectStatus", rnd.choice(["OK", "ERROR"])),
+        (compid, "GitLinesAdded", str(rnd.randint(0, 2000))),
+        (compid, "GitLinesDeleted", str(rnd.randint(0, 500))),
+        (compid, "GitLinesTotal", str(rnd.randint(1000, 90000))),
+        (compid, "GitCommittersCnt", str(rnd.randint(0, 8))),
+        (compid, "GitTotalCommittersCnt", str(rnd.randint(1, 20))),
+        (compid, "JobTriggeredBy", rnd.choice(["SCM", "user"])),
+        (compid, "license", rnd.choice("YN")),
+        (compid, "readme", rnd.choice("YN")),
+    ]
+    if rnd.random() < 0.5:
+        rows.append((compid, "VeracodeScore", str(rnd.randint(0, 100))))
+    if rnd.random() < 0.3:
+        rows.append((compid, "swagger", "Y"))
+    return rows
+
+
+def generate(scale: Scale, rngseed: int = 7) -> dict:
+    """
+    Build the table rows for a scale. The same scale and seed always give the same data.
+    """
+    rnd = random.Random(rngseed)
+    tables: dict[str, list] = {
+        name: [] for name in ("dm_env_order", "dm_environment", "dm_application", "dm_deployment", "dm_component", "dm_applicationcomponent", "dm_scorecard_nv", "dm_app_scorecard")
+    }
+
+    envnames = ["Env" + str(envid) for envid in range(1, scale.envs + 1)]
+    for envid, envname in enumerate(envnames, start=1):
+        tables["dm_environment"].append((envid, envname))
+        tables["dm_env_order"].append((envid, envname))
+
+    appid = 0
+    compid = 0
+    deploymentid = 0
+    for base in range(scale.apps):
+        appid += 1
+        parentid = appid
+        created = 1700000000 + base * 86400
+        tables["dm_application"].append((parentid, "App" + str(base), None, 1, "N", created))
+
+        compids = []
+        for comp in range(scale.components):
+            compid += 1
+            compids.append(compid)
+            tables["dm_component"].append((compid, "Comp" + str(base) + "." + str(comp), "N"))
+            tables["dm_scorecard_nv"].extend(nv_rows(rnd, compid))
+
+        for version in range(1, scale.versions + 1):
+            appid += 1
+            appname = "App" + str(base) + ";" + str(version)
+            tables["dm_application"].append((appid, appname, parentid, 1, "N", created + version * 3600))
+            # Each version keeps most of the previous components and swaps a few out
+            for cid in compids:
+                if rnd.random() < 0.9:
+                    tables["dm_applicationcomponent"].append((appid, cid))
+
+            for _ in range(scale.deployments):
+                deploymentid += 1
+                envid = rnd.randint(1, scale.envs)
+                month = "2024-%02d-01" % rnd.randint(1, 12)
+                startts = month[:8] + "%02d %02d:%02d:00" % (rnd.randint(1, 28), rnd.randint(0, 23), rnd.randint(0, 59))
+                tables["dm_deployment"].append((deploymentid, appid, envid, startts))
+                tables["dm_app_scorecard"].append((parentid, appname, envnames[envid - 1], month))
+
+    return tables
+
+
+def copy_rows(cursor, table: str, rows: list):
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join("\\N" if value is None else str(value) for value in row))
+        buf.write("\n")
+    buf.seek(0)
+    cursor.copy_expert("copy dm." + table + " from stdin", buf)
+
+
+def ensure_database(host: str, port: str, user: str, password: str, dbname: str):
+    """
+    Create the benchmark database if it is missing and point its search_path at dm, as the DeployHub database does.
+    """
+    conn = psycopg2.connect(host=host, port=port, user=user, password=password, dbname="postgres")
+    conn.autocommit = True
+    try:
+        cursor = conn.cursor()
+        cursor.execute("select 1 from pg_database where datname = %s", (dbname,))
+        if cursor.fetchone() is None:
+            cursor.execute('create database "' + dbname.replace('"', '""') + '"')
+        cursor.execute('alter database "' + dbname.replace('"', '""') + '" set search_path = dm, public')
+    finally:
+        conn.close()
+
+
+def seed(host: str, port: str, user: str, password: str, dbname: str, scale: Scale, rngseed: int = 7) -> dict:
+    """
+    (Re)create the dm schema in dbname and load a synthetic data set. Returns the row count per table.
+    """
+    ensure_database(host, port, user, password, dbname)
+    tables = generate(scale, rngseed)
+
+    conn = psycopg2.connect(host=host, port=port, user=user, password=password, dbname=dbname)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(SCHEMA)
+        for table, rows in tables.items():
+            copy_rows(cursor, table, rows)
+        cursor.execute(INDEXES)
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {table: len(rows) for table, rows in tables.items()}
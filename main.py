@@ -15,21 +15,37 @@
 # pylint: disable=E0401,E0611
 # pyright: reportMissingImports=false,reportMissingModuleSource=false
 
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import importlib
+import json
+import keyword
 import logging
 import os
 import re
 import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar, copy_context
 from datetime import datetime
-from time import sleep
-from typing import Union
+from functools import partial
+from typing import TYPE_CHECKING, Any, Literal, Union
 
-import numpy as np  # pylint: disable=E0401 # pyright: ignore[reportMissingImports]
-import pandas as pd  # pylint: disable=E0401 # pyright: ignore[reportMissingImports]
 import uvicorn
-from fastapi import FastAPI, HTTPException, Response, status
+from fastapi import FastAPI, Header, HTTPException, Response, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
 from pydantic import BaseModel  # pylint: disable=E0611
-from sqlalchemy import create_engine, sql
+from sqlalchemy import create_engine, event, sql
 from sqlalchemy.exc import InterfaceError, OperationalError
 
 tags_metadata = [
@@ -53,7 +69,124 @@ def is_blank(mystr):
 SERVICE_NAME = "ortelius-ms-scorecard"
 DB_CONN_RETRY = 3
 
-app = FastAPI(title=SERVICE_NAME, description=SERVICE_NAME)
+# Where the frequency and lag pivots are computed: "pandas" pulls the raw rows, "sql" lets Postgres reduce them first
+SCORECARD_COMPUTE = os.getenv("SCORECARD_COMPUTE", "pandas")
+
+# Rows per chunk written by format=ndjson
+SCORECARD_STREAM_CHUNK = int(os.getenv("SCORECARD_STREAM_CHUNK", "500"))
+
+# Answer GET /msapi/scorecard with an ETag derived from a cheap version query and honour If-None-Match
+SCORECARD_ETAG = os.getenv("SCORECARD_ETAG", "true").lower() in ("1", "true", "yes")
+
+# Rows per fetch when the pandas lag query is read through a server-side cursor, 0 reads it in one go
+SCORECARD_LAG_STREAM_CHUNK = int(os.getenv("SCORECARD_LAG_STREAM_CHUNK", "0"))
+
+# Open the pool, import pandas and load the reference data during startup instead of on the first request
+SCORECARD_WARMUP = os.getenv("SCORECARD_WARMUP", "false").lower() in ("1", "true", "yes")
+
+# Without VALIDATEUSER_URL it is built from a reverse lookup of MS_VALIDATE_USER_SERVICE_HOST at startup (see lifespan)
+validateuser_url = os.getenv("VALIDATEUSER_URL", "")
+
+# Seconds to wait for the reverse lookup of MS_VALIDATE_USER_SERVICE_HOST before using the address as given
+VALIDATEUSER_DNS_TIMEOUT = float(os.getenv("VALIDATEUSER_DNS_TIMEOUT", "2"))
+
+
+class LazyModule:
+    """
+    Imports a module on first attribute access. pandas and numpy account for a large part of the import time, which a pod
+    scaling out should not pay before it can report ready.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.module = None
+
+    def load(self):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return self.module
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+
+if TYPE_CHECKING:
+    # The annotations name the real modules, the proxies stand in for them at runtime
+    import numpy as np
+    import pandas as pd
+else:
+    np = LazyModule("numpy")
+    pd = LazyModule("pandas")
+
+# startup
+
+
+def process_age() -> Union[float, None]:
+    # Seconds since the process started (interpreter start-up and imports included), None where /proc is not available
+    try:
+        with open("/proc/self/stat", encoding="ascii") as stat:
+            started = int(stat.read().rsplit(")", 1)[1].split()[19]) / os.sysconf("SC_CLK_TCK")
+        with open("/proc/uptime", encoding="ascii") as uptime:
+            return float(uptime.read().split()[0]) - started
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+async def resolve_validateuser_url():
+    global validateuser_url  # pylint: disable=W0603
+
+    if len(validateuser_url) > 0:
+        return
+    validateuser_host = os.getenv("MS_VALIDATE_USER_SERVICE_HOST", "127.0.0.1")
+    host = validateuser_host
+    try:
+        loop = asyncio.get_running_loop()
+        host = (await asyncio.wait_for(loop.run_in_executor(None, socket.gethostbyaddr, validateuser_host), VALIDATEUSER_DNS_TIMEOUT))[0]
+    except (asyncio.TimeoutError, OSError) as ex:
+        logging.warning("Reverse lookup of %s failed (%s), using the address as given", validateuser_host, str(ex) or "timed out")
+    validateuser_url = "http://" + host + ":" + str(os.getenv("MS_VALIDATE_USER_SERVICE_PORT", "80"))
+
+
+def warm_up():
+    np.load()
+    pd.load()
+    # Check out pool_size connections at once so the pool holds that many when the first requests arrive
+    with ExitStack() as stack:
+        for _ in range(db_pool_size):
+            stack.enter_context(engine.connect())
+    with health_engine.connect():
+        pass
+    reference_data.env_order()
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    phases = {"import": process_age()}
+    started = time.perf_counter()
+    await resolve_validateuser_url()
+    phases["dns"] = time.perf_counter() - started
+    if SCORECARD_WARMUP:
+        started = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(db_executor, warm_up)
+        except Exception as ex:  # pylint: disable=W0718
+            # Not fatal, the first requests connect and load as they would without warm-up
+            logging.warning("Warm-up failed: %s", ex)
+        phases["warmup"] = time.perf_counter() - started
+    phases["ready"] = process_age()
+    timings = {phase: secs for phase, secs in phases.items() if secs is not None}
+    for phase, secs in timings.items():
+        STARTUP_SECONDS.labels(phase).set(secs)
+    logging.info("Startup %s", format_secs(timings))
+    yield
+
+
+# end startup
+
+app = FastAPI(title=SERVICE_NAME, description=SERVICE_NAME, lifespan=lifespan)
+
+# Responses at least this many bytes are gzipped for clients that accept it
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("SCORECARD_GZIP_MIN_SIZE", "1024")))
 
 app.mount("/reports", StaticFiles(directory="reports"), name="reports")
 
@@ -63,14 +196,206 @@ db_name = os.getenv("DB_NAME", "postgres")
 db_user = os.getenv("DB_USER", "postgres")
 db_pass = os.getenv("DB_PASS", "postgres")
 db_port = os.getenv("DB_PORT", "5432")
-validateuser_url = os.getenv("VALIDATEUSER_URL", "")
 
-if len(validateuser_url) == 0:
-    validateuser_host = os.getenv("MS_VALIDATE_USER_SERVICE_HOST", "127.0.0.1")
-    host = socket.gethostbyaddr(validateuser_host)[0]
-    validateuser_url = "http://" + host + ":" + str(os.getenv("MS_VALIDATE_USER_SERVICE_PORT", "80"))
+# Connection pool (chart values dbPool.*). With a pool_recycle shorter than the server/proxy idle timeout the pre-ping round trip
+# on every checkout can be turned off.
+db_pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+db_max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+db_pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+db_pool_recycle = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+db_pool_pre_ping = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Session-level prepared statements do not survive a transaction-pooling proxy such as pgbouncer, turn them off behind one
+db_prepared_statements = os.getenv("DB_PREPARED_STATEMENTS", "true").lower() in ("1", "true", "yes")
+
+db_url = "postgresql+psycopg2://" + db_user + ":" + db_pass + "@" + db_host + ":" + db_port + "/" + db_name
+
+
+class LazyEngine:
+    """
+    Builds its SQLAlchemy engine on first use in each process, so worker processes (uvicorn --workers, or a server that forks
+    after importing the app) each open their own pool instead of sharing connections inherited from the parent.
+    Attribute access is passed through to the engine.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.engine = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.engine is None or self.pid != os.getpid():
+            with self.lock:
+                if self.engine is None or self.pid != os.getpid():
+                    if self.engine is not None:
+                        # Inherited across a fork, drop the pool without closing the parent's connections
+                        self.engine.dispose(close=False)
+                    self.engine = self.factory()
+                    self.pid = os.getpid()
+        return self.engine
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def scorecard_engine():
+    new_engine = create_engine(db_url, pool_size=db_pool_size, max_overflow=db_max_overflow, pool_timeout=db_pool_timeout, pool_recycle=db_pool_recycle, pool_pre_ping=db_pool_pre_ping)
+    event.listen(new_engine, "connect", reset_prepared)
+    event.listen(new_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(new_engine, "after_cursor_execute", after_cursor_execute)
+    return new_engine
+
+
+engine = LazyEngine(scorecard_engine)
+
+# /health gets its own connection and thread so probes neither wait behind report queries nor take a report connection
+health_engine = LazyEngine(partial(create_engine, db_url, pool_size=1, max_overflow=0, pool_timeout=db_pool_timeout, pool_recycle=db_pool_recycle, pool_pre_ping=True))
+health_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scorecard-health")
+
+# Blocking db and pandas work runs on a bounded thread pool so the event loop stays free for other requests.
+# Keep the worker count in line with the engine pool size plus overflow.
+db_executor_workers = int(os.getenv("DB_EXECUTOR_WORKERS", str(db_pool_size + db_max_overflow)))
+db_executor = ThreadPoolExecutor(max_workers=db_executor_workers, thread_name_prefix="scorecard-db")
+
+
+async def run_in_db_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # copy_context carries the request's timer over to the worker thread
+    return await loop.run_in_executor(db_executor, copy_context().run, partial(func, *args, **kwargs))
+
+
+async def run_with_retry(func, *args, **kwargs):
+    # Retry logic for failed query
+    no_of_retry = DB_CONN_RETRY
+    attempt = 1
+    while True:
+        try:
+            return await run_in_db_executor(func, *args, **kwargs)
+        except (InterfaceError, OperationalError) as ex:
+            if attempt < no_of_retry:
+                DB_RETRIES.inc()
+                sleep_for = 0.2
+                logging.error("Database connection error: %s - sleeping for %d seconds and will retry (attempt #%d of %d)", ex, sleep_for, attempt, no_of_retry)
+                # 200ms of sleep time in cons. retry calls
+                await asyncio.sleep(sleep_for)
+                attempt += 1
+                continue
+            else:
+                raise
+
+
+# metrics
+REQUEST_SECONDS = Histogram("scorecard_request_seconds", "Scorecard request latency", ["mode", "format"])
+STAGE_SECONDS = Histogram("scorecard_stage_seconds", "Time spent in each stage of a scorecard request", ["mode", "stage"])
+POOL_WAIT_SECONDS = Histogram("scorecard_db_pool_wait_seconds", "Time spent checking a connection out of the pool")
+DB_RETRIES = Counter("scorecard_db_retries_total", "Database calls retried after a connection error")
+COALESCED = Counter("scorecard_coalesced_total", "Requests answered by joining an identical request already in flight")
+ROWS_BUILT = Counter("scorecard_rows_total", "Scorecard rows returned", ["mode"])
+BYTES_OUT = Counter("scorecard_response_bytes_total", "Scorecard response bytes", ["mode", "format"])
+# import and ready are seconds since the process started, dns and warmup the time those steps took
+STARTUP_SECONDS = Gauge("scorecard_startup_seconds", "Time taken to start the service by phase", ["phase"], multiprocess_mode="max")
+
+# Read live from the pool; with several workers (PROMETHEUS_MULTIPROC_DIR) a callback gauge cannot be aggregated, so they are left out
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    Gauge("scorecard_db_pool_size", "Connections kept in the pool").set_function(lambda: engine.pool.size())
+    Gauge("scorecard_db_pool_checked_out", "Connections currently checked out of the pool").set_function(lambda: engine.pool.checkedout())
+    Gauge("scorecard_db_pool_overflow", "Connections open beyond the pool size").set_function(lambda: engine.pool.overflow())
+
+# Requests slower than this many seconds log their stage breakdown, 0 turns it off
+SCORECARD_SLOW_SECS = float(os.getenv("SCORECARD_SLOW_SECS", "0"))
+
+
+def format_secs(stages: dict) -> str:
+    return " ".join(f"{name}={secs:.3f}s" for name, secs in stages.items())
+
+
+class RequestTimer:
+    """
+    Wall time of one request and the time it spent in each stage (pool, sql, decode, pivot, rows, render, ...).
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.start = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def record(self, name: str, secs: float):
+        self.stages[name] = self.stages.get(name, 0.0) + secs
+
+    def finish(self, format: str, nbytes: int = 0):
+        elapsed = time.perf_counter() - self.start
+        REQUEST_SECONDS.labels(self.mode, format).observe(elapsed)
+        for name, secs in self.stages.items():
+            STAGE_SECONDS.labels(self.mode, name).observe(secs)
+        if nbytes:
+            BYTES_OUT.labels(self.mode, format).inc(nbytes)
+        if 0 < SCORECARD_SLOW_SECS <= elapsed:
+            logging.warning("Slow scorecard request: mode=%s format=%s total=%.3fs %s", self.mode, format, elapsed, format_secs(self.stages))
+
+
+# Set per request and carried into db_executor threads by run_in_db_executor
+request_timer: ContextVar[Union[RequestTimer, None]] = ContextVar("request_timer", default=None)
 
-engine = create_engine("postgresql+psycopg2://" + db_user + ":" + db_pass + "@" + db_host + ":" + db_port + "/" + db_name, pool_pre_ping=True)
+
+def record_stage(name: str, secs: float):
+    timer = request_timer.get()
+    if timer is not None:
+        timer.record(name, secs)
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def db_connect():
+    """
+    engine.connect() with the pool checkout wait recorded.
+    """
+    start = time.perf_counter()
+    connection = engine.connect()
+    elapsed = time.perf_counter() - start
+    POOL_WAIT_SECONDS.observe(elapsed)
+    record_stage("pool", elapsed)
+    return connection
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    conn.info["query_secs"] = conn.info.get("query_secs", 0.0) + elapsed
+    record_stage("sql", elapsed)
+
+
+def read_sql(sqlstmt: str, connection, params: Union[dict, None] = None) -> pd.DataFrame:
+    """
+    pd.read_sql with the time spent turning the result into a DataFrame recorded apart from the query itself.
+    """
+    start = time.perf_counter()
+    query_secs = connection.info.get("query_secs", 0.0)
+    df = pd.read_sql(sql.text(sqlstmt), connection, params=params)
+    record_stage("decode", time.perf_counter() - start - (connection.info.get("query_secs", 0.0) - query_secs))
+    return df
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Several workers: aggregate the counters and histograms every process wrote
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+# end metrics
 
 
 # health check endpoint
@@ -79,20 +404,21 @@ class StatusMsg(BaseModel):
     service_name: str = ""
 
 
+def check_db() -> bool:
+    with health_engine.connect() as connection:
+        return connection.exec_driver_sql("SELECT 1").scalar() == 1
+
+
 @app.get("/health", tags=["health"])
 async def health(response: Response) -> StatusMsg:
     """
     This health check end point used by Kubernetes
     """
     try:
-        with engine.connect() as connection:
-            conn = connection.connection
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1")
-            if cursor.rowcount > 0:
-                return StatusMsg(status="UP", service_name=SERVICE_NAME)
-            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
-            return StatusMsg(status="DOWN", service_name=SERVICE_NAME)
+        if await asyncio.get_running_loop().run_in_executor(health_executor, check_db):
+            return StatusMsg(status="UP", service_name=SERVICE_NAME)
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return StatusMsg(status="DOWN", service_name=SERVICE_NAME)
 
     except Exception as err:
         print(str(err))
@@ -111,386 +437,1706 @@ class ScoreCard(BaseModel):
     data: list = []
 
 
-@app.get("/msapi/scorecard")
-async def get_scorecard(  # noqa: C901
-    frequency: Union[str, None] = None, environment: Union[str, None] = None, lag: Union[str, None] = None, appname: Union[str, None] = None, appid: Union[str, None] = None
-) -> ScoreCard:
-    domname = ""
+class CompactScoreCard(BaseModel):
+    """
+    format=compact for the default mode: column names, a type per column and one positional array per row.
+
+    types[i] is "number" (blank values are null), "string", or "dict" where the row holds an index into dictionaries[columns[i]].
+    Built with model_construct from already clean values, so rows are not validated one by one.
+    """
+
+    domain: str = ""
+    columns: list[str] = []
+    types: list[str] = []
+    dictionaries: dict[str, list] = {}
+    data: list[list] = []
+
+
+class ScoreCardPage(ScoreCard):
+    """
+    One page of a default-mode scorecard requested with limit. next is the cursor for the following page, null on the last one.
+    """
+
+    next: Union[str, None] = None
+
+
+class CompactScoreCardPage(CompactScoreCard):
+    next: Union[str, None] = None
+
+
+# response cache
+
+
+class CacheStats(BaseModel):
+    entries: int = 0
+    bytes: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidated: int = 0
+
+
+class ScoreCardCache:
+    """
+    In-process LRU cache of rendered scorecard responses with a TTL and entry/byte limits.
+    """
 
+    def __init__(self, maxsize: int, maxbytes: int, ttl: float):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.entries: OrderedDict[tuple, tuple[float, bytes]] = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidated = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, key: tuple) -> Union[bytes, None]:
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, body: bytes):
+        if not self.enabled or len(body) > self.maxbytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, body)
+            self.nbytes += len(body)
+            while len(self.entries) > self.maxsize or self.nbytes > self.maxbytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, appid: Union[str, None] = None, appname: Union[str, None] = None) -> int:
+        with self.lock:
+            if appid is None and appname is None:
+                keys = list(self.entries.keys())
+            else:
+                keys = [key for key in self.entries if (appid is not None and key[4] == appid) or (appname is not None and key[3] == appname)]
+            for key in keys:
+                self._remove(key)
+            self.invalidated += len(keys)
+            return len(keys)
+
+    def stats(self) -> CacheStats:
+        with self.lock:
+            return CacheStats(entries=len(self.entries), bytes=self.nbytes, hits=self.hits, misses=self.misses, evictions=self.evictions, invalidated=self.invalidated)
+
+    def _remove(self, key: tuple):
+        _, body = self.entries.pop(key)
+        self.nbytes -= len(body)
+
+
+class SharedScoreCardCache:
+    """
+    Rendered scorecard responses kept as files in a directory that all worker processes share (an emptyDir or /dev/shm),
+    with the same TTL, limits and invalidation as ScoreCardCache. Entries are named <appid>.<appname>.<key> digests so
+    invalidation by appid or appname is a directory listing. Hit and miss counts are per process.
+
+    Expired and excess entries are pruned with a directory scan once a process has written a tenth of maxsize or maxbytes,
+    or prune_secs after its last prune, not on every write. Between prunes the directory can run that much over its limits
+    per worker. Every method does file I/O, call them from the event loop through run_cache.
+    """
+
+    def __init__(self, directory: str, maxsize: int, maxbytes: int, ttl: float, prune_secs: float = 10):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.prune_secs = prune_secs
+        self.written = 0
+        self.writtenbytes = 0
+        self.prunedue = time.monotonic() + prune_secs
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidated = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    @staticmethod
+    def _digest(value) -> str:
+        return hashlib.md5(repr(value).encode("utf-8"), usedforsecurity=False).hexdigest()[:16]
+
+    def _path(self, key: tuple) -> str:
+        return os.path.join(self.directory, self._digest(key[4]) + "." + self._digest(key[3]) + "." + self._digest(key))
+
+    def get(self, key: tuple) -> Union[bytes, None]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            if os.stat(path).st_mtime + self.ttl < time.time():
+                self._unlink(path)
+                body = None
+            else:
+                with open(path, "rb") as entry:
+                    body = entry.read()
+        except FileNotFoundError:
+            body = None
+        with self.lock:
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return body
+
+    def put(self, key: tuple, body: bytes):
+        if not self.enabled or len(body) > self.maxbytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # Write then rename, so other workers never read a partial entry
+        tmppath = os.path.join(self.directory, ".tmp-" + str(os.getpid()) + "-" + str(threading.get_ident()))
+        with open(tmppath, "wb") as entry:
+            entry.write(body)
+        os.replace(tmppath, path)
+
+        with self.lock:
+            self.written += 1
+            self.writtenbytes += len(body)
+            due = self.written * 10 >= self.maxsize or self.writtenbytes * 10 >= self.maxbytes or time.monotonic() >= self.prunedue
+            if due:
+                self.written = 0
+                self.writtenbytes = 0
+                self.prunedue = time.monotonic() + self.prune_secs
+        if due:
+            self._prune()
+
+    def invalidate(self, appid: Union[str, None] = None, appname: Union[str, None] = None) -> int:
+        removed = 0
+        for name, _, _ in self._entries():
+            parts = name.split(".")
+            if (appid is None and appname is None) or (appid is not None and parts[0] == self._digest(appid)) or (appname is not None and parts[1] == self._digest(appname)):
+                removed += self._unlink(os.path.join(self.directory, name))
+        with self.lock:
+            self.invalidated += removed
+        return removed
+
+    def stats(self) -> CacheStats:
+        entries = self._entries()
+        with self.lock:
+            return CacheStats(entries=len(entries), bytes=sum(size for _, size, _ in entries), hits=self.hits, misses=self.misses, evictions=self.evictions, invalidated=self.invalidated)
+
+    def _entries(self) -> list:
+        try:
+            with os.scandir(self.directory) as names:
+                entries = []
+                for entry in names:
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((entry.name, stat.st_size, stat.st_mtime))
+                return entries
+        except FileNotFoundError:
+            return []
+
+    def _prune(self):
+        now = time.time()
+        live = []
+        for name, size, mtime in self._entries():
+            if mtime + self.ttl < now:
+                self._unlink(os.path.join(self.directory, name))
+            else:
+                live.append((mtime, name, size))
+        live.sort()
+        nbytes = sum(size for _, _, size in live)
+        evicted = 0
+        while live and (len(live) > self.maxsize or nbytes > self.maxbytes):
+            _, name, size = live.pop(0)
+            evicted += self._unlink(os.path.join(self.directory, name))
+            nbytes -= size
+        with self.lock:
+            self.evictions += evicted
+
+    @staticmethod
+    def _unlink(path: str) -> int:
+        try:
+            os.unlink(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+
+# With several workers, point SCORECARD_CACHE_DIR at a directory they share so one worker's result serves the others
+# and DELETE /msapi/scorecard/cache reaches every worker's entries
+scorecard_cache_dir = os.getenv("SCORECARD_CACHE_DIR", "")
+scorecard_cache_size = int(os.getenv("SCORECARD_CACHE_SIZE", "256"))
+scorecard_cache_max_bytes = int(os.getenv("SCORECARD_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+scorecard_cache_ttl = float(os.getenv("SCORECARD_CACHE_TTL", "300"))
+scorecard_cache: Union[ScoreCardCache, SharedScoreCardCache]
+if scorecard_cache_dir:
+    scorecard_cache = SharedScoreCardCache(scorecard_cache_dir, maxsize=scorecard_cache_size, maxbytes=scorecard_cache_max_bytes, ttl=scorecard_cache_ttl)
+else:
+    scorecard_cache = ScoreCardCache(maxsize=scorecard_cache_size, maxbytes=scorecard_cache_max_bytes, ttl=scorecard_cache_ttl)
+
+# The shared cache reads and writes files; it gets its own threads so cache hits do not queue behind report queries
+cache_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="scorecard-cache")
+
+
+async def run_cache(func, *args, **kwargs):
+    """
+    Call a scorecard_cache method from the event loop, on cache_executor when it does file I/O.
+    """
+    if isinstance(scorecard_cache, SharedScoreCardCache):
+        return await asyncio.get_running_loop().run_in_executor(cache_executor, partial(func, *args, **kwargs))
+    return func(*args, **kwargs)
+
+
+def render_scorecard(data: BaseModel) -> bytes:
+    # Same encoding JSONResponse uses; the row builders already hand back plain python values so jsonable_encoder is skipped
+    return json.dumps(data.model_dump(), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+# end response cache
+
+# request coalescing
+
+
+class SingleFlight:
+    """
+    Collapses identical concurrent requests. The first caller for a key starts the work as a task; callers arriving while it is
+    in flight await the same task, get its result or its exception, and give up after timeout seconds. The task is shielded, so a
+    caller that disconnects does not cancel the work for the others.
+    """
+
+    def __init__(self, enabled: bool, timeout: float, coalesced: Union[Counter, None] = COALESCED):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.coalesced = coalesced
+        self.calls: dict[tuple, asyncio.Task] = {}
+
+    async def do(self, key: tuple, func):
+        if not self.enabled:
+            return await func()
+
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self.calls[key] = task
+            task.add_done_callback(partial(self._done, key))
+            return await asyncio.shield(task)
+
+        if self.coalesced is not None:
+            self.coalesced.inc()
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout if self.timeout > 0 else None)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Timed out waiting for an identical request in progress") from None
+
+    def _done(self, key: tuple, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # Every waiter may be gone, mark the exception retrieved so asyncio does not log it again
+        if not task.cancelled():
+            task.exception()
+
+
+scorecard_flight = SingleFlight(
+    enabled=os.getenv("SCORECARD_COALESCE", "true").lower() in ("1", "true", "yes"),
+    timeout=float(os.getenv("SCORECARD_COALESCE_TIMEOUT", "30")),
+)
+
+# end request coalescing
+
+# row serialization
+
+
+def frequency_rows(table: pd.DataFrame) -> tuple[list, list]:
+    """
+    Turn the (application, environment) x month frequency pivot into month columns and [environment, counts...] rows.
+    """
+    table = table.fillna(0).astype(float)
+    months = list(table.columns)
+    environments = table.index.get_level_values("environment").tolist()
+    datarows = [[env] + counts for env, counts in zip(environments, table.to_numpy().tolist())]
+    return months, datarows
+
+
+def frequency_grid_rows(result) -> tuple[list, list]:
+    """
+    Same output as frequency_rows() for (application, environment, {month: count}) rows already reduced by Postgres.
+    """
+    result = sorted(result, key=lambda row: (row[0], row[1]))
+    months = sorted({month for row in result for month in row[2]})
+    datarows = [[row[1]] + [float(row[2].get(month, 0)) for month in months] for row in result]
+    return months, datarows
+
+
+def lag_rows(table: pd.DataFrame) -> list:
+    """
+    Turn the application x environment lag pivot into [application, days...] rows, skipping applications with no lag.
+    """
+    apps = table.iloc[:, 0].tolist()
+    days = table.iloc[:, 1:].to_numpy().tolist()
+    return [[app] + lags for app, lags in zip(apps, days) if sum(lags) > 0]
+
+
+def scorecard_columns(table: pd.DataFrame) -> tuple[list, list]:
+    """
+    Resolve the column descriptors and, per output column, (name, source position, is env flag) for the merged component table.
+
+    Each output column is resolved to its source column the same way the earlier itertuples() lookup did:
+    by name when pandas keeps the name as a tuple field, otherwise through the positional "_<n>" field name
+    (which is how the Env: columns are looked up), falling back to "". Position 0 is the index, -1 means no source.
+    """
+    cols = list(table.columns)
+    # The field names itertuples() gets from namedtuple(rename=True): invalid, keyword, underscored and repeated names become _<position>
+    fields = []
+    seen = set()
+    for index, field in enumerate(["Index"] + [str(col) for col in cols]):
+        fields.append("_" + str(index) if not field.isidentifier() or keyword.iskeyword(field) or field.startswith("_") or field in seen else field)
+        seen.add(field)
+
+    columns = []
+    sources = []
+    for col in cols[3::]:
+        if col and col in fields:
+            source = fields.index(col)
+        else:
+            key = "_" + str(cols.index(col) - 1)
+            source = fields.index(key) if key in fields else -1
+
+        name = col.lower()
+        columns.append({"name": name, "data": name})
+        sources.append((name, source, col.startswith("Env:")))
+    return columns, sources
+
+
+def scorecard_values(table: pd.DataFrame, sources: list, start: int, stop: int) -> tuple[list, list]:
+    """
+    Output column names and their value lists for table rows start:stop.
+    """
+    stop = min(stop, len(table.index))
+    names = []
+    values = []
+    for name, source, isenv in sources:
+        if source < 0:
+            colvals = [""] * (stop - start)
+        elif source == 0:
+            colvals = table.index[start:stop].tolist()
+        else:
+            colvals = table.iloc[start:stop, source - 1].tolist()
+
+        if isenv:
+            colvals = ["Y" if len(str(val).strip()) > 0 else val for val in colvals]
+
+        names.append(name)
+        values.append(colvals)
+
+    return names, values
+
+
+def scorecard_chunk(table: pd.DataFrame, sources: list, start: int, stop: int) -> list:
+    """
+    Build the row dicts for table rows start:stop, working column by column.
+    """
+    names, values = scorecard_values(table, sources, start, stop)
+    return [dict(zip(names, vals)) for vals in zip(*values)]
+
+
+def scorecard_rows(table: pd.DataFrame) -> tuple[list, list]:
+    """
+    Turn the merged component table into column descriptors and one dict per component.
+    """
+    columns, sources = scorecard_columns(table)
+    return columns, scorecard_chunk(table, sources, 0, len(table.index))
+
+
+def is_numeric(values: list) -> bool:
+    # Blank ("") values do not count, the row builders use them for missing numbers
+    present = [val for val in values if val != ""]
+    return len(present) > 0 and all(isinstance(val, (int, float)) and not isinstance(val, bool) for val in present)
+
+
+def compact_scorecard(names: list, values: list) -> CompactScoreCard:
+    """
+    Encode scorecard columns for format=compact. Strings that repeat (application names, Y/N flags) are dictionary encoded.
+    """
+    types = []
+    dictionaries = {}
+    encoded = []
+    for name, colvals in zip(names, values):
+        if is_numeric(colvals):
+            types.append("number")
+            encoded.append([None if val == "" else val for val in colvals])
+            continue
+
+        distinct = list(dict.fromkeys(colvals))
+        if len(distinct) * 2 <= len(colvals):
+            positions = {val: k for k, val in enumerate(distinct)}
+            types.append("dict")
+            dictionaries[name] = distinct
+            encoded.append([positions[val] for val in colvals])
+        else:
+            types.append("string")
+            encoded.append(colvals)
+
+    return CompactScoreCard.model_construct(domain="", columns=names, types=types, dictionaries=dictionaries, data=[list(row) for row in zip(*encoded)])
+
+
+def compact_from_rows(data: ScoreCard) -> CompactScoreCard:
+    """
+    format=compact from a scorecard that was already built as row dicts (a materialized one).
+    """
+    names = [col["name"] for col in data.columns]
+    return compact_scorecard(names, [[row.get(name, "") for row in data.data] for name in names])
+
+
+def iter_scorecard_rows(table: pd.DataFrame, sources: list, chunksize: int):
+    for start in range(0, len(table.index), chunksize):
+        yield from scorecard_chunk(table, sources, start, start + chunksize)
+
+
+def ndjson_lines(data: ScoreCard, chunksize: int):
+    """
+    Encode a scorecard as newline delimited json: a {"domain", "columns"} header line (plus "next" for a page) followed by one line per row.
+    """
+    header: dict[str, Any] = {"domain": data.domain, "columns": data.columns}
+    if isinstance(data, ScoreCardPage):
+        header["next"] = data.next
+    yield (json.dumps(header, ensure_ascii=False, allow_nan=False, separators=(",", ":")) + "\n").encode("utf-8")
+    lines = []
+    for row in data.data:
+        lines.append(json.dumps(row, ensure_ascii=False, allow_nan=False, separators=(",", ":")))
+        if len(lines) >= chunksize:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# end row serialization
+
+# columnar export
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "compact": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def typed_column(values: list) -> pd.Series:
+    """
+    Recover the column type the json rows lost: numbers (with "" as null) stay numeric, anything else becomes a string column.
+    """
+    series = pd.Series(values, dtype=object)
+    if is_numeric(values):
+        series = series.replace("", None)
+        if all(isinstance(val, int) for val in values if val != ""):
+            return series.astype("Int64")
+        return series.astype("float64")
+    return series.astype(str)
+
+
+def scorecard_frame(data: ScoreCard, label: Union[str, None], counts: bool = False) -> pd.DataFrame:
+    """
+    Rebuild a typed DataFrame from a scorecard. Positional rows (frequency, lag) carry their label column first.
+    """
+    if label is None:
+        names = [col["name"] for col in data.columns]
+        rows = [[row.get(name, "") for name in names] for row in data.data]
+    else:
+        # An empty frequency/lag result keeps its label as the only column name, it is not a data column
+        names = [label] + [col for col in data.columns if col != label]
+        rows = data.data
+
+    frame = pd.DataFrame({name: typed_column([row[k] for row in rows]) for k, name in enumerate(names)}, columns=names)
+    if counts and label is not None and len(frame.index) > 0:
+        frame[names[1:]] = frame[names[1:]].fillna(0).astype("int64")
+    return frame
+
+
+def export_scorecard(data: ScoreCard, format: str, label: Union[str, None], counts: bool = False) -> bytes:
     try:
-        # Retry logic for failed query
-        no_of_retry = DB_CONN_RETRY
-        attempt = 1
+        import pyarrow as pa  # pylint: disable=C0415
+        import pyarrow.parquet as pq  # pylint: disable=C0415
+    except ImportError:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="format=" + format + " requires pyarrow, install the arrow extra") from None
+
+    # A page carries its next cursor in the schema metadata
+    metadata = {"next": data.next} if isinstance(data, ScoreCardPage) and data.next is not None else None
+    table = pa.Table.from_pandas(scorecard_frame(data, label, counts), preserve_index=False).replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    if format == "parquet":
+        pq.write_table(table, sink)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# end columnar export
+
+# reference data cache
+
+
+class PostgresReferenceSource:
+    """
+    Loads the slow-changing reference sets (environment ordering and parent application ids) from the DeployHub database.
+    """
+
+    def load_env_order(self) -> list[str]:
+        with db_connect() as connection:
+            cursor = connection.connection.cursor()
+            cursor.execute("SELECT envname from dm.dm_env_order order by id asc")
+            return [row[0] for row in cursor.fetchall()]
+
+    def load_parents(self) -> dict[str, int]:
+        with db_connect() as connection:
+            cursor = connection.connection.cursor()
+            cursor.execute("select id, coalesce(parentid,id) as parentid from dm.dm_application")
+            return {str(row[0]): row[1] for row in cursor.fetchall()}
+
+    def lookup_parent(self, appid: str) -> int:
+        with db_connect() as connection:
+            cursor = connection.connection.cursor()
+            params = tuple([appid, appid])
+            cursor.execute("select distinct coalesce(parentid,id) as parentid from dm.dm_application where id = %s or parentid = %s", params)
+            for row in cursor.fetchall():
+                return row[0] if row[0] else -1
+            return -1
+
+
+class ReferenceData:
+    """
+    Shared in-memory copy of the reference sets. The first access loads synchronously, after that stale data is
+    served while a background thread refreshes it. Swap the source for a local stand-in in tests.
+    """
+
+    def __init__(self, source, refresh_secs: float):
+        self.source = source
+        self.refresh_secs = refresh_secs
+        self.envorder: list[str] = []
+        self.parents: dict[str, int] = {}
+        self.loaded_at = 0.0
+        self.refreshing = False
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        try:
+            envorder = self.source.load_env_order()
+            parents = self.source.load_parents()
+            with self.lock:
+                self.envorder = envorder
+                self.parents = parents
+                self.loaded_at = time.monotonic()
+        finally:
+            self.refreshing = False
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = 0.0
+
+    def _ensure_loaded(self):
+        if self.loaded_at == 0.0:
+            with self.lock:
+                self.refreshing = True
+            self.refresh()
+        elif time.monotonic() - self.loaded_at > self.refresh_secs and not self.refreshing:
+            with self.lock:
+                if self.refreshing:
+                    return
+                self.refreshing = True
+            threading.Thread(target=self.refresh, name="scorecard-refdata", daemon=True).start()
+
+    def env_order(self) -> list[str]:
+        self._ensure_loaded()
+        return list(self.envorder)
+
+    def parent_id(self, appid: str) -> int:
+        self._ensure_loaded()
+        parentid = self.parents.get(str(appid))
+        if parentid is None:
+            # App created since the last refresh
+            parentid = self.source.lookup_parent(appid)
+            with self.lock:
+                self.parents[str(appid)] = parentid
+        return parentid
+
+
+reference_data = ReferenceData(PostgresReferenceSource(), refresh_secs=float(os.getenv("REFERENCE_REFRESH_SECS", "60")))
+
+# end reference data cache
+
+
+def reset_prepared(dbapi_connection, connection_record):
+    # A new or reconnected session has no prepared statements yet
+    connection_record.info.pop("prepared", None)
+
+
+def prepare(connection, name: str, sqlstmt: str, types: dict) -> str:
+    """
+    Prepare a fixed scorecard query once per pooled connection so Postgres does not parse and plan it on every call.
+
+    sqlstmt uses :name binds, types maps each bind to its Postgres type. Returns the statement to execute with the same binds:
+    EXECUTE name(...) once prepared, or sqlstmt itself when prepared statements are turned off.
+    """
+    if not db_prepared_statements:
+        return sqlstmt
+
+    prepared = connection.info.setdefault("prepared", set())
+    if name not in prepared:
+        stmt = sqlstmt
+        for index, param in enumerate(types, start=1):
+            stmt = re.sub(r"(?<![:\w]):" + param + r"\b", "$" + str(index), stmt)
+        cursor = connection.connection.cursor()
+        cursor.execute("PREPARE " + name + (" (" + ", ".join(types.values()) + ")" if types else "") + " AS " + stmt)
+        prepared.add(name)
+
+    if not types:
+        return "EXECUTE " + name
+    return "EXECUTE " + name + "(" + ", ".join("CAST(:" + param + " AS " + pgtype + ")" for param, pgtype in types.items()) + ")"
+
+
+def month_labels(cols: list) -> list:
+    for index, item in enumerate(cols):
+        if "-" in item:
+            dt = datetime.strptime(item, "%Y-%m-%d")
+            cols[index] = dt.strftime("%b %Y")
+    return cols
+
+
+def frequency_scorecards(connection, parentids: list, compute: str, window: tuple = (None, None)) -> dict:
+    """
+    Deployment frequency per environment and month for each parent application id, from one query over all of them.
+
+    window is a (since, before) pair of month starts from month_window, either end open when None.
+    """
+    cards = {}
+    since, before = window
+    params = {"parentids": parentids, "since": since, "before": before}
+    types = {"parentids": "integer[]", "since": "timestamp", "before": "timestamp"}
+
+    if compute == "sql":
+        # One row per application/environment with its month -> count map, so only the final grid comes back. Rows without a
+        # month, application or environment are kept as they are for the pandas path: they make the parent present, not a grid row.
+        sqlstmt = (
+            "select parentid, application, environment, json_object_agg(month, frequency) filter (where month is not null) as months from ("
+            "select parentid, application, environment, (monthly::date)::varchar as month, count(monthly) as frequency from dm.dm_app_scorecard "
+            "where parentid = ANY(:parentids) and (monthly is null or monthly >= coalesce(CAST(:since AS timestamp), '-infinity') and monthly < coalesce(CAST(:before AS timestamp), 'infinity')) "
+            "group by parentid, application, month, environment) f "
+            "group by parentid, application, environment"
+        )
+        result = connection.execute(sql.text(prepare(connection, "scorecard_frequency_grid", sqlstmt, types)), params).fetchall()
+
+        grouped: dict[int, list] = {}
+        for row in result:
+            rows = grouped.setdefault(row[0], [])
+            if row[1] is not None and row[2] is not None and row[3] is not None:
+                rows.append(row[1:])
+
+        for parentid in parentids:
+            cols: list[str] = ["Environment"]
+            datarows: list[list] = []
+            if parentid in grouped:
+                with stage("rows"):
+                    cols, datarows = frequency_grid_rows(grouped[parentid])
+            cards[parentid] = ScoreCard(columns=month_labels(cols), data=datarows)
+    else:
+        sqlstmt = (
+            "select parentid, application, environment, (monthly::date)::varchar as month, count(monthly) as frequency from dm.dm_app_scorecard "
+            "where parentid = ANY(:parentids) and (monthly is null or monthly >= coalesce(CAST(:since AS timestamp), '-infinity') and monthly < coalesce(CAST(:before AS timestamp), 'infinity')) "
+            "group by parentid, application, month, environment "
+            "order by parentid, application, month desc, environment"
+        )
+        df = read_sql(prepare(connection, "scorecard_frequency", sqlstmt, types), connection, params)
+        groups = dict(tuple(df.groupby("parentid")))
+
+        for parentid in parentids:
+            cols, datarows = ["Environment"], []
+            group = groups.get(parentid)
+            if group is not None and len(group.index) > 0:
+                with stage("pivot"):
+                    table = group.pivot_table(values="frequency", index=["application", "environment"], columns="month")
+                with stage("rows"):
+                    cols, datarows = frequency_rows(table)
+            cards[parentid] = ScoreCard(columns=month_labels(cols), data=datarows)
+
+    return cards
+
+
+def lag_scorecard(lagtab: pd.DataFrame, envorder: list) -> ScoreCard:
+    """
+    Days between application creation and its latest deployment per environment, from the latest deployment rows.
+    """
+    data = ScoreCard()
+
+    if len(lagtab.index) > 0:
+        with stage("pivot"):
+            lagtab.assign(**lagtab[["created", "deployed"]].apply(pd.to_datetime, format="%Y-%m-%d %H:%M:%S"), inplace=True)
+            lagtab["diff"] = round((lagtab.deployed - lagtab.created).fillna(pd.Timedelta(seconds=0)).dt.total_seconds() / 86400.0, 2)
+            lagtab.drop("deploymentid", axis=1, inplace=True)
+            lagtab.drop("created", axis=1, inplace=True)
+            lagtab.drop("deployed", axis=1, inplace=True)
+            table = lagtab.pivot_table(values=["diff"], index=["application"], columns=["environment"]).reset_index()
+            table.fillna(0, inplace=True)
+
+            cols = list(table.columns)
+            newcols = ["Application"]
+            for col in cols:
+                if col[0] == "diff":
+                    newcols.append(col[1])
+
+            sortedcols = ["Application"]
+            for item in envorder:
+                if item in newcols:
+                    sortedcols.append(item)
+            table.columns = sortedcols
+
+        with stage("rows"):
+            datarows = lag_rows(table)
+        cols = list(table.columns)[1:]
+    else:
+        cols = ["Application"]
+        datarows = []
+
+    data.columns = cols
+    data.data = datarows
+
+    return data
+
+
+def lag_extremes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keep only the first and the latest deployment row of each application/environment, all the lag pivot and env ordering need.
+    """
+    keys = ["appname", "application", "environment"]
+    ordered = df.sort_values(by=keys + ["deploymentid"])
+    return ordered[~ordered.duplicated(keys, keep="first") | ~ordered.duplicated(keys, keep="last")]
+
+
+def read_lag_stream(sqlstmt: str, connection, params: dict, chunksize: int) -> pd.DataFrame:
+    """
+    Read the lag query through a named server-side cursor chunksize rows at a time, reducing as it goes, so memory follows the
+    number of application/environment pairs rather than the deployment history.
+    """
+    stmt = sql.text(sqlstmt).execution_options(stream_results=True, max_row_buffer=chunksize)
+    df = None
+    with stage("stream"):
+        for chunk in pd.read_sql(stmt, connection, params=params, chunksize=chunksize):
+            df = lag_extremes(chunk if df is None else pd.concat([df, chunk]))
+    return df
+
+
+def lag_scorecards(connection, envorder: list, appnames: list, compute: str) -> dict:
+    """
+    Lag scorecards for each base application name, from one query over all of them.
+    """
+    cards = {}
+
+    if compute == "sql":
+        # Postgres keeps only the latest deployment per application/environment, plus each environment's first deployment for the fallback ordering
+        sqlstmt = (
+            "SELECT DISTINCT ON (appname, application, environment) appname, application, environment, deploymentid, created, deployed, "
+            "min(deploymentid) OVER (PARTITION BY appname, environment) AS firstdeploymentid "
+            "FROM ("
+            "SELECT c.name AS appname, "
+            "a.name AS application, "
+            "d.name AS environment, "
+            "b.deploymentid, "
+            "to_timestamp(a.created)::timestamp(0) as created, "
+            "b.startts::timestamp(0) as deployed "
+            "FROM dm_application a, "
+            "dm_deployment b, "
+            "dm_application c, "
+            "dm_environment d "
+            "WHERE a.id = b.appid AND b.envid = d.id "
+            "AND a.parentid = c.id AND c.name = ANY(:appnames) "
+            "AND deploymentid > 0 "
+            "UNION "
+            "SELECT a.name AS appname, "
+            "a.name AS application, "
+            "d.name AS environment, "
+            "b.deploymentid, "
+            "to_timestamp(a.created)::timestamp(0) as created, "
+            "b.startts::timestamp(0) as deployed "
+            "FROM dm_application a, "
+            "dm_deployment b, "
+            "dm_environment d "
+            "WHERE a.id = b.appid AND b.envid = d.id "
+            "AND a.parentid IS NULL AND a.name = ANY(:appnames) "
+            "AND deploymentid > 0 "
+            ") deps "
+            "WHERE application IS NOT NULL AND environment IS NOT NULL "
+            "ORDER BY appname, application, environment, deploymentid DESC"
+        )
+        df = read_sql(prepare(connection, "scorecard_lag_latest", sqlstmt, {"appnames": "text[]"}), connection, {"appnames": appnames})
+        groups = dict(tuple(df.groupby("appname")))
+
+        for appname in appnames:
+            lagtab = groups.get(appname, df.iloc[0:0]).drop("appname", axis=1)
+            grouporder = envorder
+            if len(lagtab.index) > 0 and not grouporder:
+                envdf = lagtab[["environment", "firstdeploymentid"]].sort_values(by=["firstdeploymentid", "environment"]).drop_duplicates(subset=["environment"])
+                grouporder = envdf["environment"].to_list()
+            cards[appname] = lag_scorecard(lagtab.drop("firstdeploymentid", axis=1), grouporder)
+    else:
+        sqlstmt = (
+            "SELECT c.name AS appname, "
+            "a.name AS application, "
+            "d.name AS environment, "
+            "b.deploymentid, "
+            "to_timestamp(a.created)::timestamp(0) as created, "
+            "b.startts::timestamp(0) as deployed "
+            "FROM dm_application a, "
+            "dm_deployment b, "
+            "dm_application c, "
+            "dm_environment d "
+            "WHERE a.id = b.appid AND b.envid = d.id "
+            "AND a.parentid = c.id AND c.name = ANY(:appnames) "
+            "AND deploymentid > 0 "
+            "UNION "
+            "SELECT a.name AS appname, "
+            "a.name AS application, "
+            "d.name AS environment, "
+            "b.deploymentid, "
+            "to_timestamp(a.created)::timestamp(0) as created, "
+            "b.startts::timestamp(0) as deployed "
+            "FROM dm_application a, "
+            "dm_deployment b, "
+            "dm_environment d "
+            "WHERE a.id = b.appid AND b.envid = d.id "
+            "AND a.parentid IS NULL AND a.name = ANY(:appnames) "
+            "AND deploymentid > 0 "
+            "order by appname, application, environment, deploymentid "
+        )
+        if SCORECARD_LAG_STREAM_CHUNK > 0:
+            # A cursor cannot be declared over EXECUTE, so the streamed read runs the statement text
+            df = read_lag_stream(sqlstmt, connection, {"appnames": appnames}, SCORECARD_LAG_STREAM_CHUNK)
+        else:
+            df = read_sql(prepare(connection, "scorecard_lag", sqlstmt, {"appnames": "text[]"}), connection, {"appnames": appnames})
+        groups = dict(tuple(df.groupby("appname")))
+
+        for appname in appnames:
+            group = groups.get(appname, df.iloc[0:0]).drop("appname", axis=1)
+            grouporder = envorder
+            if len(group.index) > 0 and not grouporder:
+                envdf = group[["environment", "deploymentid"]].copy()
+                envdf = envdf.sort_values(by=["deploymentid", "environment"]).groupby(["environment"]).head(1)
+                grouporder = envdf["environment"].to_list()
+
+            lagtab = group.sort_values(by=["application", "environment", "deploymentid"], ascending=[True, True, False]).groupby(["application", "environment"]).head(1)
+            cards[appname] = lag_scorecard(lagtab, grouporder)
+
+    return cards
+
+
+def scorecard_envtable(connection, envorder: list) -> pd.DataFrame:
+    """
+    The environments each application has been deployed to, as Env:_<name> columns in env order. Shared by every app.
+    """
+    # Read data from PostgreSQL database table and load into a DataFrame instance
+    sqlstmt = """
+        select distinct a.id as appid, b.name as environment
+        from dm.dm_application a, dm.dm_environment b, dm.dm_deployment c where a.id = c.appid and c.envid = b.id order by 1, 2
+    """
+
+    df = read_sql(prepare(connection, "scorecard_envtable", sqlstmt, {}), connection)
+    with stage("pivot"):
+        envtable = df.pivot(index="appid", columns="environment", values="environment")
+
+        cols = list(envtable.columns)
+        newcols = []
+        for envname in envorder:
+            if envname in cols:
+                newcols.append(envname)
+        missingcols = list(set(cols).difference(set(newcols)))
+        newcols.extend(missingcols)
+        envtable = envtable.reindex(columns=newcols)
+
+        cols = []
+        for col in list(envtable.columns):
+            cols.append("Env:_" + col)
+        envtable.columns = cols
+
+    return envtable
+
+
+def scorecard_table(df: pd.DataFrame, envtable: pd.DataFrame, flags: Union[set, None] = None) -> pd.DataFrame:
+    """
+    Pivot the component name/value rows into one row per component, fill the defaults and join the environment columns.
+
+    A license/readme/swagger flag no component has defaults to "N", otherwise it is blank where missing. When df is one page
+    of an application's components, flags are the ones present across all of them so the page matches the whole scorecard.
+    """
+    apptable = df.pivot(index=["appid", "compid", "domainid", "application", "component"], columns=["name"], values=["value"]).reset_index()
+    apptable.columns = ["_".join(re.findall(".[^A-Z]*", re.sub(r"^value_", "", "_".join(tup).rstrip("_")))) for tup in apptable.columns.values]
+
+    if "license" not in apptable.columns:
+        apptable.insert(1, "license", "" if flags is not None and "license" in flags else "N")
+
+    if "readme" not in apptable.columns:
+        apptable.insert(1, "readme", "" if flags is not None and "readme" in flags else "N")
+
+    if "swagger" not in apptable.columns:
+        apptable.insert(1, "swagger", "" if flags is not None and "swagger" in flags else "N")
+
+    if "Git_Committers_Cnt" not in apptable.columns:
+        apptable.insert(1, "Git_Committers_Cnt", 0)
+
+    if "Git_Total_Committers_Cnt" not in apptable.columns:
+        apptable.insert(1, "Git_Total_Committers_Cnt", 0)
+
+    if "Job_Triggered_By" not in apptable.columns:
+        apptable.insert(1, "Job_Triggered_By", "")
+
+    if "Sonar_Bugs" not in apptable.columns:
+        apptable.insert(1, "Sonar_Bugs", "")
+
+    if "Sonar_Code_Smells" not in apptable.columns:
+        apptable.insert(1, "Sonar_Code_Smells", "")
+
+    if "Sonar_Violations" not in apptable.columns:
+        apptable.insert(1, "Sonar_Violations", "")
+
+    if "Sonar_Project_Status" not in apptable.columns:
+        apptable.insert(1, "Sonar_Project_Status", "")
+
+    if "Veracode_Score" not in apptable.columns:
+        apptable.insert(1, "Veracode_Score", "")
+
+    if "Git_Lines_Added" not in apptable.columns:
+        apptable.insert(1, "Git_Lines_Added", 0)
+
+    if "Git_Lines_Deleted" not in apptable.columns:
+        apptable.insert(1, "Git_Lines_Deleted", 0)
+
+    if "Git_Lines_Total" not in apptable.columns:
+        apptable.insert(1, "Git_Lines_Total", 0)
+
+    if "Lines_Changed" not in apptable.columns:
+        apptable.insert(1, "Lines_Changed", 0)
+
+    apptable["Git_Lines_Added"] = pd.to_numeric(apptable["Git_Lines_Added"], errors="coerce").fillna(0).astype("int")
+    apptable["Git_Lines_Deleted"] = pd.to_numeric(apptable["Git_Lines_Deleted"], errors="coerce").fillna(0).astype("int")
+    apptable["Git_Lines_Total"] = pd.to_numeric(apptable["Git_Lines_Total"], errors="coerce").fillna(0).astype("int")
+
+    apptable["Lines_Changed"] = apptable["Git_Lines_Added"] + apptable["Git_Lines_Deleted"]
+    apptable["Lines_Changed"] = apptable["Lines_Changed"].div(apptable["Git_Lines_Total"]).replace(np.inf, 0).round(2) * 100
+
+    apptable.drop("Git_Lines_Added", axis=1, inplace=True)
+    apptable.drop("Git_Lines_Deleted", axis=1, inplace=True)
+    apptable.drop("Git_Lines_Total", axis=1, inplace=True)
+
+    apptable["Git_Committers_Cnt"] = pd.to_numeric(apptable["Git_Committers_Cnt"], errors="coerce").fillna(0).astype("int")
+    apptable["Git_Total_Committers_Cnt"] = pd.to_numeric(apptable["Git_Total_Committers_Cnt"], errors="coerce").fillna(0).astype("int")
+
+    apptable["Contributing_Committers"] = apptable["Git_Committers_Cnt"].div(apptable["Git_Total_Committers_Cnt"]).replace(np.inf, 0).round(2) * 100
+
+    apptable.drop("Git_Committers_Cnt", axis=1, inplace=True)
+
+    apptable.set_index(["appid", "compid"])
+
+    apptable.Job_Triggered_By = apptable.Job_Triggered_By.apply(lambda x: "Y" if "SCM" in str(x) else "N")
+
+    apptable["appver"] = apptable.application.apply(lambda x: re.sub(r"(\d+)", pad_number, x))
+    apptable.sort_values(by=["appver", "component"], ascending=[False, False], inplace=True)
+    apptable.drop("appver", axis=1, inplace=True)
+
+    apptable = apptable.reindex(
+        columns=[
+            "appid",
+            "compid",
+            "domainid",
+            "application",
+            "component",
+            "Sonar_Bugs",
+            "Sonar_Code_Smells",
+            "Sonar_Violations",
+            "Sonar_Project_Status",
+            "Veracode_Score",
+            "Job_Triggered_By",
+            "Contributing_Committers",
+            "Git_Total_Committers_Cnt",
+            "Lines_Changed",
+            "swagger",
+            "readme",
+            "license",
+        ]
+    )
+
+    table = pd.merge(apptable, envtable, how="left", on="appid")
+    table = table.fillna("")
+    table.rename(columns={"Job_Triggered_By": "Git_Trigger"}, inplace=True)
+    table.rename(columns={"Git_Total_Committers_Cnt": "Total_Committers"}, inplace=True)
+
+    return table
+
+
+def default_scorecards(connection, envorder: list, appids: list, stream: bool = False, compact: bool = False, page: Union[tuple, None] = None) -> dict:
+    """
+    Component scorecards for each application id (and its sibling versions), from one query over all of them.
+
+    With stream set the ScoreCards are unvalidated and their data is a row iterator. With compact set they are CompactScoreCards.
+    With page, an (after, limit) pair from page_cursor, each is a ScoreCardPage/CompactScoreCardPage of the first limit components
+    after that cursor in the usual (appver, component) descending order.
+    """
+    envtable = scorecard_envtable(connection, envorder)
+    params: dict[str, Any] = {"appids": [appid for appid in appids if appid is not None]}
+    flags = {}
+
+    if page is None:
+        # r is the requested application, c runs over it and the other versions under the same parent
+        sqlstmt = """
+            select distinct r.id as reqid, c.domainid, c.id as appid, b.id as compid, c.name as application, b.name as component, a.name as name, a.value as value
+            from dm.dm_scorecard_nv a, dm.dm_component b, dm.dm_application c, dm.dm_applicationcomponent d, dm.dm_application r
+            where a.id = b.id and b.status = 'N' and c.status = 'N' and a.id = d.compid and c.id = d.appid and
+            r.id = ANY(CAST(:appids AS integer[])) and (c.id = r.id or c.parentid = r.parentid)
+        """
+        df = read_sql(prepare(connection, "scorecard_default", sqlstmt, {"appids": "integer[]"}), connection, params)
+    else:
+        # The page's components are picked first, one past the limit to tell whether another page follows, and only their
+        # name/value rows are read. appver is pad_number applied in SQL and "C" collation compares the way python does, so the
+        # keyset follows the order scorecard_table sorts in (ties in appid, compid order as they come out of the pivot).
+        sqlstmt = r"""
+            select distinct p.reqid, c.domainid, c.id as appid, b.id as compid, c.name as application, b.name as component, a.name as name, a.value as value
+            from dm.dm_scorecard_nv a, dm.dm_component b, dm.dm_application c, (
+                select r.id as reqid, k.appid, k.compid from dm.dm_application r cross join lateral (
+                    select k.appid, k.compid from (
+                        select distinct c.id as appid, b.id as compid, b.name collate "C" as component,
+                        regexp_replace(regexp_replace(c.name, '(\d+)', '00\1', 'g'), '0*(\d{3,})', '\1', 'g') collate "C" as appver
+                        from dm.dm_component b, dm.dm_application c, dm.dm_applicationcomponent d
+                        where b.status = 'N' and c.status = 'N' and b.id = d.compid and c.id = d.appid and (c.id = r.id or c.parentid = r.parentid) and
+                        exists (select 1 from dm.dm_scorecard_nv a where a.id = b.id)
+                    ) k
+                    where :afterver is null or k.appver < :afterver or k.appver = :afterver and
+                    (k.component < :aftercomp or k.component = :aftercomp and (k.appid, k.compid) > (:afterappid, :aftercompid))
+                    order by k.appver desc, k.component desc, k.appid, k.compid limit :limit
+                ) k
+                where r.id = ANY(CAST(:appids AS integer[]))
+            ) p
+            where a.id = p.compid and b.id = p.compid and c.id = p.appid
+        """
+        after, limit = page
+        afterapp, aftercomp, afterappid, aftercompid = after if after is not None else (None, None, None, None)
+        params.update(
+            {
+                "afterver": re.sub(r"(\d+)", pad_number, afterapp) if afterapp is not None else None,
+                "aftercomp": aftercomp,
+                "afterappid": afterappid,
+                "aftercompid": aftercompid,
+                "limit": limit + 1,
+            }
+        )
+        types = {"appids": "integer[]", "afterver": "text", "aftercomp": "text", "afterappid": "integer", "aftercompid": "integer", "limit": "integer"}
+        df = read_sql(prepare(connection, "scorecard_default_page", sqlstmt, types), connection, params)
+
+        sqlstmt = """
+            select r.id, array_agg(distinct a.name)
+            from dm.dm_scorecard_nv a, dm.dm_component b, dm.dm_application c, dm.dm_applicationcomponent d, dm.dm_application r
+            where a.id = b.id and b.status = 'N' and c.status = 'N' and a.id = d.compid and c.id = d.appid and
+            r.id = ANY(CAST(:appids AS integer[])) and (c.id = r.id or c.parentid = r.parentid) and a.name in ('license', 'readme', 'swagger')
+            group by r.id
+        """
+        result = connection.execute(sql.text(prepare(connection, "scorecard_default_flags", sqlstmt, {"appids": "integer[]"})), {"appids": params["appids"]}).fetchall()
+        flags = {row[0]: set(row[1]) for row in result}
+    groups = dict(tuple(df.groupby("reqid")))
+
+    cards: dict[str, Union[ScoreCard, CompactScoreCard]] = {}
+    for appid in appids:
+        reqid = int(appid) if appid is not None else None
+        group = groups.get(reqid, df.iloc[0:0])
+        with stage("pivot"):
+            table = scorecard_table(group.drop("reqid", axis=1), envtable, flags.get(reqid, set()) if page is not None else None)
+
+        cursor = None
+        if page is not None and len(table.index) > page[1]:
+            table = table.iloc[: page[1]]
+            last = table.iloc[-1]
+            cursor = encode_cursor(last["application"], last["component"], int(last["appid"]), int(last["compid"]))
+
+        if stream:
+            # Rows are built chunk by chunk as the response is written instead of all up front
+            columns, sources = scorecard_columns(table)
+            cards[appid] = ScoreCard.model_construct(domain="", columns=columns, data=iter_scorecard_rows(table, sources, SCORECARD_STREAM_CHUNK))
+        elif compact:
+            with stage("rows"):
+                _, sources = scorecard_columns(table)
+                cards[appid] = compact_scorecard(*scorecard_values(table, sources, 0, len(table.index)))
+        else:
+            with stage("rows"):
+                columns, rows = scorecard_rows(table)
+            cards[appid] = ScoreCard(columns=columns, data=rows)
+
+        if page is not None:
+            pagetype = CompactScoreCardPage if compact and not stream else ScoreCardPage
+            cards[appid] = pagetype.model_construct(**dict(cards[appid]), next=cursor)
+
+    return cards
+
+
+def fetch_scorecard(
+    frequency: Union[str, None],
+    environment: Union[str, None],
+    lag: Union[str, None],
+    appname: Union[str, None],
+    appid: Union[str, None],
+    compute: str = SCORECARD_COMPUTE,
+    stream: bool = False,
+    compact: bool = False,
+    window: tuple = (None, None),
+    page: Union[tuple, None] = None,
+) -> Union[ScoreCard, CompactScoreCard]:
+    """
+    Run the scorecard queries and pivots. This is blocking work and is called from a db_executor thread.
+
+    With stream set the default mode returns an unvalidated ScoreCard whose data is a row iterator, with compact set a CompactScoreCard.
+    window limits the frequency months (see month_window), page selects one page of the default mode (see page_cursor).
+    """
+    # Reference data is loaded before checking out the connection, a cold load takes one of its own
+    with stage("refdata"):
+        envorder = reference_data.env_order()
+        parentid = reference_data.parent_id(appid) if frequency is not None and appid is not None else -1
+
+    with db_connect() as connection:
+        if frequency is not None:
+            return frequency_scorecards(connection, [parentid], compute, window)[parentid]
+        elif lag is not None:
+            return lag_scorecards(connection, envorder, [appname], compute)[appname]
+        else:
+            return default_scorecards(connection, envorder, [appid], stream, compact, page)[appid]
+
+
+def fetch_scorecard_batch(items: list, compute: str = SCORECARD_COMPUTE) -> list:
+    """
+    Run a batch of scorecard requests on one connection, with one query per mode covering every item of that mode.
+    """
+    with stage("refdata"):
+        envorder = reference_data.env_order()
+        parentids = {item.appid: reference_data.parent_id(item.appid) if item.appid is not None else -1 for item in items if item.mode == "frequency"}
+    appnames = list(dict.fromkeys(item.appname for item in items if item.mode == "lag"))
+    appids = list(dict.fromkeys(item.appid for item in items if item.mode == "scorecard"))
+
+    with db_connect() as connection:
+        frequencies = frequency_scorecards(connection, list(dict.fromkeys(parentids.values())), compute) if parentids else {}
+        lags = lag_scorecards(connection, envorder, appnames, compute) if appnames else {}
+        scorecards = default_scorecards(connection, envorder, appids) if appids else {}
+
+    results = []
+    for item in items:
+        if item.mode == "frequency":
+            results.append(frequencies[parentids[item.appid]])
+        elif item.mode == "lag":
+            results.append(lags[item.appname])
+        else:
+            results.append(scorecards[item.appid])
+    return results
+
+
+# time windows and pagination
+
+
+def month_window(since: Union[str, None], until: Union[str, None]) -> tuple:
+    """
+    The frequency months since..until (YYYY-MM, both inclusive) as a (since, before) pair of month starts, None for an open end.
+    """
+    window: list[Union[datetime, None]] = []
+    for param, month in (("since", since), ("until", until)):
+        if month is None:
+            window.append(None)
+            continue
+        try:
+            start = datetime.strptime(month, "%Y-%m")
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=param + " must be a month as YYYY-MM") from None
+        window.append(start if param == "since" else datetime(start.year + start.month // 12, start.month % 12 + 1, 1))
+    return tuple(window)
+
+
+def encode_cursor(application: str, component: str, appid: int, compid: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([application, component, appid, compid], ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+
+def page_cursor(cursor: Union[str, None], limit: Union[int, None]) -> Union[tuple, None]:
+    """
+    The default-mode page after cursor (the next value of a previous page) as an (after, limit) pair, after being the
+    (application, component, appid, compid) of that page's last row. None without limit, which returns every component as before.
+    """
+    if limit is None:
+        if cursor is not None:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="cursor needs limit")
+        return None
+    if limit < 1:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="limit must be at least 1")
+    if cursor is None:
+        return (None, limit)
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not (isinstance(after, list) and len(after) == 4 and all(isinstance(val, str) for val in after[:2]) and all(isinstance(val, int) for val in after[2:])):
+            raise ValueError(cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="cursor must be the next value of a previous page") from None
+    return (tuple(after), limit)
+
+
+def scorecard_view(mode: str, since: Union[str, None], until: Union[str, None], cursor: Union[str, None], limit: Union[int, None]) -> tuple:
+    """
+    The slice of the scorecard a request asks for: the month window in the frequency mode, the page in the default mode.
+    Parameters the mode does not use are left out so they do not split the cache.
+    """
+    if mode == "frequency":
+        return month_window(since, until)
+    if mode == "default":
+        return page_cursor(cursor, limit) or ()
+    return ()
+
+
+def view_params(mode: str, view: tuple) -> dict:
+    # fetch_scorecard's window and page for a view
+    return {"window": view if mode == "frequency" else (None, None), "page": view if mode == "default" and view else None}
+
+
+# end time windows and pagination
+
+# materialized scorecards
+
+
+def scorecard_envmark(connection, envorder: list) -> tuple:
+    """
+    Watermark of what every default-mode scorecard shares: the env order and the set of environments deployed to.
+    """
+    sqlstmt = """
+        select md5(coalesce(string_agg(b.name, ',' order by b.name), '')) from dm.dm_environment b
+        where exists (select 1 from dm.dm_deployment c, dm.dm_application a where a.id = c.appid and c.envid = b.id)
+    """
+    return (tuple(envorder), connection.execute(sql.text(prepare(connection, "scorecard_envmark", sqlstmt, {}))).scalar())
+
+
+def scorecard_marks(connection, appids: list) -> dict:
+    """
+    Per application id watermark: the latest deployment id across its versions, and the number of its component name/value
+    rows with the sum of a hash of each one (application, component and their names, name and value). The sum is order
+    independent, so it costs about what count(*) does while an in-place value edit or a rename still changes it.
+    """
+    sqlstmt = """
+        select r.id,
+        (select max(c.deploymentid) from dm.dm_deployment c, dm.dm_application v
+         where c.appid = v.id and (v.id = r.id or v.parentid = r.parentid)) as deploymentid,
+        nv.rows, nv.digest
+        from dm.dm_application r cross join lateral (
+         select count(*) as rows, sum(hashtextextended(concat_ws(':', c.id, c.domainid, c.name, b.id, b.name, a.name, a.value), 0)) as digest
+         from dm.dm_scorecard_nv a, dm.dm_component b, dm.dm_application c, dm.dm_applicationcomponent d
+         where a.id = b.id and b.status = 'N' and c.status = 'N' and a.id = d.compid and c.id = d.appid and
+         (c.id = r.id or c.parentid = r.parentid)) nv
+        where r.id = ANY(CAST(:appids AS integer[]))
+    """
+    result = connection.execute(sql.text(prepare(connection, "scorecard_marks", sqlstmt, {"appids": "integer[]"})), {"appids": appids}).fetchall()
+    return {str(row[0]): (row[1], row[2], row[3]) for row in result}
+
+
+class ScoreCardStore:
+    """
+    Precomputed default-mode scorecards for the applications that have been asked for recently.
+
+    A worker thread compares each application's watermark (see scorecard_marks) with the one the stored scorecard was built
+    from, and rebuilds only the applications that changed, in one set-based pass. A change to the deployed environment set or env order rebuilds everything.
+    Each pass hashes the name/value rows of every tracked application, so its cost grows with those rows and with maxapps.
+    Entries are kept in least recently read order within maxapps and maxbytes (their rendered json size), and one not read for
+    idle_secs is dropped instead of refreshed.
+    """
+
+    def __init__(self, enabled: bool, refresh_secs: float, maxapps: int, maxbytes: int, idle_secs: float):
+        self.enabled = enabled
+        self.refresh_secs = refresh_secs
+        self.maxapps = maxapps
+        self.maxbytes = maxbytes
+        self.idle_secs = idle_secs
+        # appid -> (watermark, scorecard, rendered size, last read)
+        self.entries: OrderedDict[str, tuple[Union[tuple, None], ScoreCard, int, float]] = OrderedDict()
+        self.nbytes = 0
+        self.envmark: Union[tuple, None] = None
+        self.worker: Union[threading.Thread, None] = None
+        self.lock = threading.Lock()
+
+    def get(self, appid: Union[str, None], mark: Union[tuple, None] = None) -> Union[ScoreCard, None]:
+        """
+        The stored scorecard, or None. With mark, an (envmark, app watermark) pair, only if it was built from that exact state.
+        """
+        if not self.enabled or appid is None:
+            return None
+        with self.lock:
+            entry = self.entries.get(appid)
+            if entry is None:
+                return None
+            self.entries[appid] = entry[:3] + (time.monotonic(),)
+            self.entries.move_to_end(appid)
+        if mark is not None and (self.envmark, entry[0]) != mark:
+            return None
+        return entry[1]
+
+    def track(self, appid: Union[str, None], data: ScoreCard, nbytes: int):
+        """
+        Keep a freshly computed scorecard, nbytes as json (0 when not known yet). It has no watermark yet, so the next pass
+        rebuilds it once to pin one down and measure it.
+        """
+        if not self.enabled or appid is None or nbytes > self.maxbytes:
+            return
+        with self.lock:
+            self._put(appid, None, data, nbytes, time.monotonic())
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name="scorecard-materialize", daemon=True)
+                self.worker.start()
+
+    def invalidate(self, appid: Union[str, None] = None) -> int:
+        """
+        Drop the stored scorecard of appid, or all of them.
+        """
+        with self.lock:
+            appids = list(self.entries.keys()) if appid is None else [appid] if appid in self.entries else []
+            for key in appids:
+                self._remove(key)
+            if appid is None:
+                self.envmark = None
+            return len(appids)
+
+    def run(self):
         while True:
+            time.sleep(self.refresh_secs)
             try:
-                with engine.connect() as connection:
-                    conn = connection.connection
-                    conn.cursor()
-
-                    envorder = []
-                    env_cursor = conn.cursor()
-                    env_cursor.execute("SELECT envname from dm.dm_env_order order by id asc")
-                    rows = env_cursor.fetchall()
-
-                    for row in rows:
-                        envorder.append(row[0])
-
-                    if frequency is not None:
-
-                        parentid = -1
-
-                        if appid is not None:
-                            app_cursor = conn.cursor()
-                            params = tuple([appid, appid])
-                            app_cursor.execute("select distinct coalesce(parentid,id) as parentid from dm.dm_application where id = %s or parentid = %s", params)
-                            rows = app_cursor.fetchall()
-
-                            for row in rows:
-                                parentid = row[0] if row[0] else -1
-                                break
-
-                        data = ScoreCard()
-
-                        sqlstmt = (
-                            "select application, environment, (monthly::date)::varchar as month, count(monthly) as frequency from dm.dm_app_scorecard "
-                            "where parentid=:parentid "
-                            "group by application, month, environment "
-                            "order by application, month desc, environment"
-                        )
-                        df = pd.read_sql(sql.text(sqlstmt), connection, params={"parentid": parentid})
-
-                        if len(df.index) > 0:
-                            table = df.pivot_table(values=["frequency"], index=["application", "environment", "month"], columns=["month"])
-
-                            table = table.fillna(0)
-                            cols = list(table.columns)
-
-                            cols.insert(0, "Environment")
-                            cols.insert(0, "Application")
-
-                            appmap: dict[tuple, dict] = {}
-                            rows = []
-                            # using a itertuples()
-                            for i in table.itertuples():
-                                row = i.Index
-                                application = row[0]
-                                environment = row[1]
-
-                                rowdict = {}
-                                rowdict.update({cols[0]: row[0]})
-                                rowdict.update({cols[1]: row[1]})
-                                rowdict = appmap.get((application, environment), rowdict)
-
-                                for col in cols[2::]:
-                                    val = None
-                                    if val is None:
-                                        key = "_" + str(cols.index(col) - 1)
-                                        val = getattr(i, key, 0)
-
-                                    if rowdict.get(col[1], 0) == 0:
-                                        rowdict.update({col[1]: val})
-                                appmap.update({(application, environment): rowdict})
-
-                            rows = list(appmap.values())
-
-                            cols = []
-                            if len(rows) > 0:
-                                cols = list(rows[0].keys())
-                                cols.remove("Application")
-                                cols.remove("Environment")
-                                cols.sort()
-
-                            datarows = []
-                            for row in rows:
-                                newrow = []
-                                newrow.append(row.get("Environment"))
-                                for col in cols:
-                                    newrow.append(row.get(col, 0))
-                                datarows.append(newrow)
-
-                            for index, item in enumerate(cols):
-                                if "-" in item:
-                                    dt = datetime.strptime(item, "%Y-%m-%d")
-                                    cols[index] = dt.strftime("%b %Y")
-                        else:
-                            cols = ["Environment"]
-                            datarows = []
-
-                        data.columns = cols
-                        data.data = datarows
-                        return data
-                    elif lag is not None:
-                        data = ScoreCard()
-
-                        cols = []
-
-                        sqlstmt = (
-                            "SELECT a.name AS application, "
-                            "d.name AS environment, "
-                            "b.deploymentid, "
-                            "to_timestamp(a.created)::timestamp(0) as created, "
-                            "b.startts::timestamp(0) as deployed "
-                            "FROM dm_application a, "
-                            "dm_deployment b, "
-                            "dm_application c, "
-                            "dm_environment d "
-                            "WHERE a.id = b.appid AND b.envid = d.id "
-                            "AND a.parentid = c.id AND c.name = :appname "
-                            "AND deploymentid > 0 "
-                            "UNION "
-                            "SELECT a.name AS application, "
-                            "d.name AS environment, "
-                            "b.deploymentid, "
-                            "to_timestamp(a.created)::timestamp(0) as created, "
-                            "b.startts::timestamp(0) as deployed "
-                            "FROM dm_application a, "
-                            "dm_deployment b, "
-                            "dm_application c, "
-                            "dm_environment d "
-                            "WHERE a.id = b.appid AND b.envid = d.id "
-                            "AND a.parentid IS NULL AND a.name = :appname "
-                            "AND deploymentid > 0 "
-                            "order by application, environment, deploymentid "
-                        )
-
-                        df = pd.read_sql(sql.text(sqlstmt), connection, params={"appname": appname})
-
-                        if len(df.index) > 0:
-                            if not envorder:
-                                envdf = df[["environment", "deploymentid"]].copy()
-                                envdf = envdf.sort_values(by=["deploymentid", "environment"]).groupby(["environment"]).head(1)
-                                envorder = envdf["environment"].to_list()
-
-                            lagtab = df.sort_values(by=["application", "environment", "deploymentid"], ascending=[True, True, False]).groupby(["application", "environment"]).head(1)
-                            lagtab.assign(**lagtab[["created", "deployed"]].apply(pd.to_datetime, format="%Y-%m-%d %H:%M:%S"), inplace=True)
-                            lagtab["diff"] = round((lagtab.deployed - lagtab.created).fillna(pd.Timedelta(seconds=0)).dt.total_seconds() / 86400.0, 2)
-                            lagtab.drop("deploymentid", axis=1, inplace=True)
-                            lagtab.drop("created", axis=1, inplace=True)
-                            lagtab.drop("deployed", axis=1, inplace=True)
-                            table = lagtab.pivot_table(values=["diff"], index=["application"], columns=["environment"]).reset_index()
-                            table.fillna(0, inplace=True)
-
-                            cols = list(table.columns)
-                            newcols = ["Application"]
-                            for col in cols:
-                                if col[0] == "diff":
-                                    newcols.append(col[1])
-
-                            sortedcols = ["Application"]
-                            for item in envorder:
-                                if item in newcols:
-                                    sortedcols.append(item)
-                            table.columns = sortedcols
-
-                            datarows = []
-                            # using a itertuples()
-                            for row in table.itertuples():
-                                outrow = []
-
-                                for k in range(1, len(row)):
-                                    outrow.append(row[k])
-
-                                if sum(outrow[1:]) > 0:
-                                    datarows.append(outrow)
-                            cols = list(table.columns)[1:]
-                        else:
-                            cols = ["Application"]
-                            datarows = []
-
-                        data.columns = cols
-                        data.data = datarows
-
-                        return data
-                    else:
-                        data = ScoreCard()
-                        # Read data from PostgreSQL database table and load into a DataFrame instance
-                        sqlstmt = """
-                            select distinct a.id as appid, b.name as environment
-                            from dm.dm_application a, dm.dm_environment b, dm.dm_deployment c where a.id = c.appid and c.envid = b.id order by 1, 2
-                        """
-
-                        df = pd.read_sql(sql.text(sqlstmt), connection)
-                        envtable = df.pivot(index="appid", columns="environment", values="environment")
-
-                        cols = list(envtable.columns)
-                        newcols = []
-                        for envname in envorder:
-                            if envname in cols:
-                                newcols.append(envname)
-                        missingcols = list(set(cols).difference(set(newcols)))
-                        newcols.extend(missingcols)
-                        envtable = envtable.reindex(columns=newcols)
-
-                        cols = []
-                        for col in list(envtable.columns):
-                            cols.append("Env:_" + col)
-                        envtable.columns = cols
-
-                        sqlstmt = """
-                            select distinct c.domainid, c.id as appid, b.id as compid, c.name as application, b.name as component, a.name as name, a.value as value
-                            from dm.dm_scorecard_nv a, dm.dm_component b, dm.dm_application c, dm.dm_applicationcomponent d
-                            where a.id = b.id and b.status = 'N' and c.status = 'N' and a.id = d.compid and c.id = d.appid and
-                            (c.id = :appid or c.parentid in (select parentid from dm.dm_application where id = :appid))
-                        """
-
-                        df = pd.read_sql(sql.text(sqlstmt), connection, params={"appid": appid})
-
-                        apptable = df.pivot(index=["appid", "compid", "domainid", "application", "component"], columns=["name"], values=["value"]).reset_index()
-                        apptable.columns = ["_".join(re.findall(".[^A-Z]*", re.sub(r"^value_", "", "_".join(tup).rstrip("_")))) for tup in apptable.columns.values]
-
-                        if "license" not in apptable.columns:
-                            apptable.insert(1, "license", "N")
-
-                        if "readme" not in apptable.columns:
-                            apptable.insert(1, "readme", "N")
-
-                        if "swagger" not in apptable.columns:
-                            apptable.insert(1, "swagger", "N")
-
-                        if "Git_Committers_Cnt" not in apptable.columns:
-                            apptable.insert(1, "Git_Committers_Cnt", 0)
-
-                        if "Git_Total_Committers_Cnt" not in apptable.columns:
-                            apptable.insert(1, "Git_Total_Committers_Cnt", 0)
-
-                        if "Job_Triggered_By" not in apptable.columns:
-                            apptable.insert(1, "Job_Triggered_By", "")
-
-                        if "Sonar_Bugs" not in apptable.columns:
-                            apptable.insert(1, "Sonar_Bugs", "")
-
-                        if "Sonar_Code_Smells" not in apptable.columns:
-                            apptable.insert(1, "Sonar_Code_Smells", "")
-
-                        if "Sonar_Violations" not in apptable.columns:
-                            apptable.insert(1, "Sonar_Violations", "")
-
-                        if "Sonar_Project_Status" not in apptable.columns:
-                            apptable.insert(1, "Sonar_Project_Status", "")
-
-                        if "Veracode_Score" not in apptable.columns:
-                            apptable.insert(1, "Veracode_Score", "")
-
-                        if "Git_Lines_Added" not in apptable.columns:
-                            apptable.insert(1, "Git_Lines_Added", 0)
-
-                        if "Git_Lines_Deleted" not in apptable.columns:
-                            apptable.insert(1, "Git_Lines_Deleted", 0)
-
-                        if "Git_Lines_Total" not in apptable.columns:
-                            apptable.insert(1, "Git_Lines_Total", 0)
-
-                        if "Lines_Changed" not in apptable.columns:
-                            apptable.insert(1, "Lines_Changed", 0)
-
-                        apptable["Git_Lines_Added"] = pd.to_numeric(apptable["Git_Lines_Added"], errors="coerce").fillna(0).astype("int")
-                        apptable["Git_Lines_Deleted"] = pd.to_numeric(apptable["Git_Lines_Deleted"], errors="coerce").fillna(0).astype("int")
-                        apptable["Git_Lines_Total"] = pd.to_numeric(apptable["Git_Lines_Total"], errors="coerce").fillna(0).astype("int")
-
-                        apptable["Lines_Changed"] = apptable["Git_Lines_Added"] + apptable["Git_Lines_Deleted"]
-                        apptable["Lines_Changed"] = apptable["Lines_Changed"].div(apptable["Git_Lines_Total"]).replace(np.inf, 0).round(2) * 100
-
-                        apptable.drop("Git_Lines_Added", axis=1, inplace=True)
-                        apptable.drop("Git_Lines_Deleted", axis=1, inplace=True)
-                        apptable.drop("Git_Lines_Total", axis=1, inplace=True)
-
-                        apptable["Git_Committers_Cnt"] = pd.to_numeric(apptable["Git_Committers_Cnt"], errors="coerce").fillna(0).astype("int")
-                        apptable["Git_Total_Committers_Cnt"] = pd.to_numeric(apptable["Git_Total_Committers_Cnt"], errors="coerce").fillna(0).astype("int")
-
-                        apptable["Contributing_Committers"] = apptable["Git_Committers_Cnt"].div(apptable["Git_Total_Committers_Cnt"]).replace(np.inf, 0).round(2) * 100
-
-                        apptable.drop("Git_Committers_Cnt", axis=1, inplace=True)
-
-                        apptable.set_index(["appid", "compid"])
-
-                        apptable.Job_Triggered_By = apptable.Job_Triggered_By.apply(lambda x: "Y" if "SCM" in str(x) else "N")
-
-                        apptable["appver"] = apptable.application.apply(lambda x: re.sub(r"(\d+)", pad_number, x))
-                        apptable.sort_values(by=["appver", "component"], ascending=[False, False], inplace=True)
-                        apptable.drop("appver", axis=1, inplace=True)
-
-                        apptable = apptable.reindex(
-                            columns=[
-                                "appid",
-                                "compid",
-                                "domainid",
-                                "application",
-                                "component",
-                                "Sonar_Bugs",
-                                "Sonar_Code_Smells",
-                                "Sonar_Violations",
-                                "Sonar_Project_Status",
-                                "Veracode_Score",
-                                "Job_Triggered_By",
-                                "Contributing_Committers",
-                                "Git_Total_Committers_Cnt",
-                                "Lines_Changed",
-                                "swagger",
-                                "readme",
-                                "license",
-                            ]
-                        )
-
-                        table = pd.merge(apptable, envtable, how="left", on="appid")
-                        table = table.fillna("")
-                        table.rename(columns={"Job_Triggered_By": "Git_Trigger"}, inplace=True)
-                        table.rename(columns={"Git_Total_Committers_Cnt": "Total_Committers"}, inplace=True)
-
-                        cols = list(table.columns)
-                        data.columns = []
-                        for col in cols[3::]:
-                            col = col.lower()
-                            column = {"name": col, "data": col}
-                            data.columns.append(column)
-
-                        rows = []
-                        # using a itertuples()
-                        for i in table.itertuples():
-                            row = i.Index
-                            rowdict = {}
-
-                            for col in cols[3::]:
-                                val = None
-                                if col:
-                                    val = getattr(i, col, None)
-                                if val is None:
-                                    key = "_" + str(cols.index(col) - 1)
-                                    val = getattr(i, key, "")
-
-                                valstr = ""
-                                if val is not None:
-                                    valstr = str(val)
-
-                                if col.startswith("Env:") and len(valstr.strip()) > 0:
-                                    val = "Y"
-                                col = col.lower()
-                                rowdict.update({col: val})
-                            rows.append(rowdict)
-
-                        data.data = rows
-                        data.domain = domname
-                        return data
-
-            except (InterfaceError, OperationalError) as ex:
-                if attempt < no_of_retry:
-                    sleep_for = 0.2
-                    logging.error("Database connection error: %s - sleeping for %d seconds and will retry (attempt #%d of %d)", ex, sleep_for, attempt, no_of_retry)
-                    # 200ms of sleep time in cons. retry calls
-                    sleep(sleep_for)
-                    attempt += 1
-                    continue
-                else:
-                    raise
+                self.refresh()
+            except Exception as err:
+                logging.error("Scorecard materialization failed: %s", err)
+
+    def refresh(self):
+        if self.idle_secs > 0:
+            idle = time.monotonic() - self.idle_secs
+            with self.lock:
+                for appid in [appid for appid, entry in self.entries.items() if entry[3] < idle]:
+                    self._remove(appid)
+
+        entries = dict(self.entries)
+        if not entries:
+            return
+
+        envorder = reference_data.env_order()
+        with db_connect() as connection:
+            envmark = scorecard_envmark(connection, envorder)
+            marks = scorecard_marks(connection, list(entries.keys()))
+
+            changed = [appid for appid, entry in entries.items() if envmark != self.envmark or entry[0] != marks.get(str(int(appid)))]
+            if not changed:
+                return
+
+            cards = default_scorecards(connection, envorder, changed)
+        sizes = {appid: len(render_scorecard(cards[appid])) for appid in changed}
+
+        with self.lock:
+            self.envmark = envmark
+            for appid in changed:
+                # Read while this pass ran: keep its place and last read time. Invalidated or evicted meanwhile: leave it out.
+                entry = self.entries.get(appid)
+                if entry is not None:
+                    self._put(appid, marks.get(str(int(appid))), cards[appid], sizes[appid], entry[3])
+        for appid in changed:
+            scorecard_cache.invalidate(appid=appid)
+
+    def _put(self, appid: str, mark: Union[tuple, None], data: ScoreCard, nbytes: int, lastread: float):
+        entry = self.entries.get(appid)
+        if entry is not None:
+            self.nbytes -= entry[2]
+        self.entries[appid] = (mark, data, nbytes, lastread)
+        self.nbytes += nbytes
+        while self.entries and (len(self.entries) > self.maxapps or self.nbytes > self.maxbytes):
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, appid: str):
+        _, _, nbytes, _ = self.entries.pop(appid)
+        self.nbytes -= nbytes
+
+
+scorecard_store = ScoreCardStore(
+    enabled=os.getenv("SCORECARD_MATERIALIZE", "false").lower() in ("1", "true", "yes"),
+    refresh_secs=float(os.getenv("SCORECARD_MATERIALIZE_SECS", "30")),
+    maxapps=int(os.getenv("SCORECARD_MATERIALIZE_MAX_APPS", "500")),
+    maxbytes=int(os.getenv("SCORECARD_MATERIALIZE_MAX_BYTES", str(64 * 1024 * 1024))),
+    idle_secs=float(os.getenv("SCORECARD_MATERIALIZE_IDLE_SECS", "3600")),
+)
+
+# end materialized scorecards
+
+# conditional requests
+
+
+def scorecard_version(frequency: Union[str, None], lag: Union[str, None], appname: Union[str, None], appid: Union[str, None]) -> tuple:
+    """
+    A cheap token that changes whenever the scorecard for this scope would, from small aggregate queries instead of the pivots.
+    Frequency follows the application's dm_app_scorecard rows, lag the deployments of its versions and the default mode the
+    materializer's watermarks. Each sums a hash of the rows it covers, so values edited in place and renames change the token
+    as well as new rows do. This is blocking work and is called from a db_executor thread.
+    """
+    with stage("refdata"):
+        envorder = reference_data.env_order()
+        parentid = reference_data.parent_id(appid) if frequency is not None and appid is not None else -1
+
+    with db_connect() as connection:
+        if frequency is not None:
+            # The rows the frequency query counts, hashed so a rewritten row changes the token as well as an added one
+            sqlstmt = """
+                select count(*), sum(hashtextextended(concat_ws(':', application, environment, monthly), 0)) from dm.dm_app_scorecard
+                where parentid = :parentid
+            """
+            row = connection.execute(sql.text(prepare(connection, "scorecard_frequency_version", sqlstmt, {"parentid": "integer"})), {"parentid": parentid}).one()
+            return ("frequency", parentid, row[0], row[1])
+        elif lag is not None:
+            sqlstmt = """
+                select max(c.deploymentid), count(*), sum(hashtextextended(concat_ws(':', v.name, v.created, c.deploymentid, d.name, c.startts), 0))
+                from dm.dm_deployment c, dm.dm_environment d, dm.dm_application v left join dm.dm_application p on p.id = v.parentid
+                where c.appid = v.id and c.envid = d.id and coalesce(p.name, v.name) = :appname
+            """
+            row = connection.execute(sql.text(prepare(connection, "scorecard_lag_version", sqlstmt, {"appname": "text"})), {"appname": appname}).one()
+            return ("lag", tuple(envorder), row[0], row[1], row[2])
+        elif appid is None:
+            return ("default", None)
+        else:
+            return ("default", scorecard_envmark(connection, envorder), scorecard_marks(connection, [appid]).get(str(int(appid))))
+
+
+class VersionCache:
+    """
+    Version tokens per scope, kept for ttl seconds so cache hits and coalesced requests do not each check out a connection
+    and run the version queries. Concurrent lookups of the same scope share one query. An ETag can trail a change by ttl.
+    """
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries: OrderedDict[tuple, tuple[float, tuple]] = OrderedDict()
+        self.flight = SingleFlight(enabled=True, timeout=scorecard_flight.timeout, coalesced=None)
+
+    async def get(self, scope: tuple, func) -> tuple:
+        entry = self.entries.get(scope)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        version = await self.flight.do(scope, func)
+        if self.ttl > 0:
+            self.entries[scope] = (time.monotonic() + self.ttl, version)
+            self.entries.move_to_end(scope)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return version
+
+    def invalidate(self):
+        self.entries.clear()
+
+
+scorecard_versions = VersionCache(ttl=float(os.getenv("SCORECARD_VERSION_TTL", "5")), maxsize=int(os.getenv("SCORECARD_VERSION_CACHE_SIZE", "4096")))
+
+
+def scorecard_etag(version: tuple, format: str, view: tuple) -> str:
+    # Weak, since the same representation may go out gzipped or not
+    return 'W/"' + hashlib.md5(repr((version, format, view)).encode("utf-8"), usedforsecurity=False).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Union[str, None], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in tags]
+
+
+# end conditional requests
+
+
+async def build_scorecard(cachekey: tuple, mode: str) -> bytes:
+    """
+    Compute, encode and cache one scorecard response. Identical concurrent requests share a single call through scorecard_flight.
+    """
+    frequency, lag, environment, appname, appid, compute, format, version, view = cachekey
+    defaultmode = frequency is None and lag is None
+    params = view_params(mode, view)
+    page = params["page"]
+    # With a version token only a stored scorecard built from that same state may answer. The store keeps whole scorecards, not pages.
+    stored = scorecard_store.get(appid, version[1:] if version is not None else None) if defaultmode and page is None else None
+    compact = defaultmode and format == "compact"
+    data: Union[ScoreCard, CompactScoreCard]
+    if stored is None:
+        data = await run_with_retry(fetch_scorecard, frequency, environment, lag, appname, appid, compute, compact=compact, **params)
+    elif compact:
+        with stage("rows"):
+            data = compact_from_rows(stored)
+    else:
+        data = stored
+    ROWS_BUILT.labels(mode).inc(len(data.data))
+    if format in ("json", "compact"):
+        with stage("render"):
+            body = render_scorecard(data)
+    else:
+        label = "Environment" if frequency is not None else "Application" if lag is not None else None
+        with stage("export"):
+            body = await run_in_db_executor(export_scorecard, data, format, label, counts=frequency is not None)
+    if stored is None and defaultmode and page is None and isinstance(data, ScoreCard):
+        # Not a compact card. The store sizes entries by their json rendering, the other formats are measured by its next pass
+        scorecard_store.track(appid, data, len(body) if format == "json" else 0)
+    await run_cache(scorecard_cache.put, cachekey, body)
+    return body
+
+
+@app.get(
+    "/msapi/scorecard",
+    response_model=ScoreCard,
+    responses={
+        200: {
+            "description": "A ScoreCard (a CompactScoreCard for format=compact, a page with next when limit is given) or the format's stream",
+            "content": {"application/x-ndjson": {}, MEDIA_TYPES["arrow"]: {}, MEDIA_TYPES["parquet"]: {}},
+        },
+        304: {"description": "Not Modified, If-None-Match still matches the ETag"},
+    },
+)
+async def get_scorecard(
+    frequency: Union[str, None] = None,
+    environment: Union[str, None] = None,
+    lag: Union[str, None] = None,
+    appname: Union[str, None] = None,
+    appid: Union[str, None] = None,
+    compute: Union[Literal["pandas", "sql"], None] = None,
+    format: Union[Literal["json", "compact", "ndjson", "arrow", "parquet"], None] = None,
+    since: Union[str, None] = None,
+    until: Union[str, None] = None,
+    limit: Union[int, None] = None,
+    cursor: Union[str, None] = None,
+    if_none_match: Union[str, None] = Header(default=None),
+) -> Response:
+    """
+    format=ndjson streams a {"domain", "columns"} header line followed by one json line per row. Streamed responses are not cached.
+
+    format=arrow (Arrow IPC stream) and format=parquet return the same table with typed columns. Frequency and lag results
+    carry their Environment/Application label as the first column.
+
+    format=compact returns the default mode as a CompactScoreCard (positional typed rows, dictionary-encoded strings); frequency
+    and lag rows are positional already and come back as for json.
+
+    Non-streamed responses carry an ETag; a request whose If-None-Match still matches gets 304 without the scorecard being built.
+
+    since/until (YYYY-MM, inclusive) limit the frequency mode to those months. limit pages the default mode: the response
+    gains a "next" cursor (null on the last page) to pass back as cursor for the following page.
+    """
+    computemode = compute or SCORECARD_COMPUTE
+    format = format or "json"
+    mode = "frequency" if frequency is not None else "lag" if lag is not None else "default"
+    timer = RequestTimer(mode)
+    request_timer.set(timer)
+    body = b""
+    try:
+        view = scorecard_view(mode, since, until, cursor, limit)
+        if format == "ndjson":
+            data = await run_with_retry(fetch_scorecard, frequency, environment, lag, appname, appid, computemode, stream=True, **view_params(mode, view))
+            return StreamingResponse(ndjson_lines(data, SCORECARD_STREAM_CHUNK), media_type="application/x-ndjson")
+
+        version = None
+        if SCORECARD_ETAG:
+            scope = (mode, appname, appid) if mode == "lag" else (mode, appid)
+            version = await scorecard_versions.get(scope, partial(run_with_retry, scorecard_version, frequency, lag, appname, appid))
+        headers = {"ETag": scorecard_etag(version, format, view)} if version is not None else None
+        if headers is not None and etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        # The version is part of the key, so a cached body is never served under a newer ETag
+        cachekey = (frequency, lag, environment, appname, appid, computemode, format, version, view)
+        cached = await run_cache(scorecard_cache.get, cachekey)
+        body = cached if cached is not None else await scorecard_flight.do(cachekey, partial(build_scorecard, cachekey, mode))
+        return Response(content=body, media_type=MEDIA_TYPES[format], headers=headers)
 
     except HTTPException:
         raise
     except Exception as err:
         print(str(err))
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(err)) from None
+    finally:
+        timer.finish(format, len(body))
+
+
+class ScoreCardRequest(BaseModel):
+    mode: Literal["scorecard", "frequency", "lag"] = "scorecard"
+    appid: Union[str, None] = None
+    appname: Union[str, None] = None
+
+
+class ScoreCardBatch(BaseModel):
+    items: list[ScoreCardRequest] = []
+    compute: Union[Literal["pandas", "sql"], None] = None
+
+
+class ScoreCardBatchResult(BaseModel):
+    results: list[ScoreCard] = []
+
+
+@app.post("/msapi/scorecard/batch", response_model=ScoreCardBatchResult)
+async def get_scorecard_batch(batch: ScoreCardBatch) -> Response:
+    """
+    Several scorecards in one call. Items are answered in order; frequency and lag items take appid and appname the same way the GET does.
+    """
+    timer = RequestTimer("batch")
+    request_timer.set(timer)
+    body = b""
+    try:
+        results = await run_with_retry(fetch_scorecard_batch, batch.items, batch.compute or SCORECARD_COMPUTE)
+        ROWS_BUILT.labels("batch").inc(sum(len(result.data) for result in results))
+        with stage("render"):
+            body = render_scorecard(ScoreCardBatchResult.model_construct(results=results))
+        return Response(content=body, media_type="application/json")
+
+    except HTTPException:
+        raise
+    except Exception as err:
+        print(str(err))
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(err)) from None
+    finally:
+        timer.finish("json", len(body))
+
+
+@app.get("/msapi/scorecard/cache")
+async def get_scorecard_cache() -> CacheStats:
+    return await run_cache(scorecard_cache.stats)
+
+
+@app.delete("/msapi/scorecard/cache")
+async def invalidate_scorecard_cache(appid: Union[str, None] = None, appname: Union[str, None] = None) -> CacheStats:
+    """
+    Drop cached scorecard responses and stored (materialized) scorecards for an appid and/or appname, or everything
+    (including reference data) when neither is given.
+    """
+    await run_cache(scorecard_cache.invalidate, appid=appid, appname=appname)
+    scorecard_versions.invalidate()
+    # The store keeps default-mode scorecards only, an appname alone does not name any of them
+    if appid is not None or appname is None:
+        scorecard_store.invalidate(appid)
+    if appid is None and appname is None:
+        reference_data.invalidate()
+    return await run_cache(scorecard_cache.stats)
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, port=5010)
+    # WEB_CONCURRENCY sets the worker count as it does for the uvicorn command line (the container entrypoint). Spawned workers
+    # import the app themselves, which only works when this file is not also loaded as __main__, so hand over to the command line.
+    if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        os.execvp(sys.executable, [sys.executable, "-m", "uvicorn", "main:app", "--port", "5010"])
+    uvicorn.run(app, port=5010, workers=1)
 
 # Frequecy per month per env
 # Time lag per env
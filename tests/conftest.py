@@ -0,0 +1,33 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# main mounts ./reports and builds VALIDATEUSER_URL from the environment when it is imported
+os.chdir(ROOT)
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("VALIDATEUSER_URL", "http://localhost")
+
+
+@pytest.fixture(scope="session")
+def main():
+    import main as module  # pylint: disable=C0415
+
+    return module
@@ -0,0 +1,96 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from contextlib import nullcontext
+
+import pytest
+
+
+class StandInSource:
+    def load_env_order(self) -> list[str]:
+        return ["Dev", "Prod"]
+
+    def load_parents(self) -> dict[str, int]:
+        return {"1": 1, "2": 1, "3": 3}
+
+    def lookup_parent(self, appid: str) -> int:
+        return -1
+
+
+@pytest.fixture
+def queries(main, monkeypatch):
+    """
+    Every mode answered without a database, recording the ids each query was asked for.
+    """
+    queries: dict[str, list] = {}
+
+    def frequency_scorecards(connection, parentids, compute):
+        queries["frequency"] = (parentids, compute)
+        return {parentid: main.ScoreCard(columns=["Environment"], data=[["parent " + str(parentid)]]) for parentid in parentids}
+
+    def lag_scorecards(connection, envorder, appnames, compute):
+        queries["lag"] = (appnames, compute)
+        return {appname: main.ScoreCard(columns=envorder, data=[[appname]]) for appname in appnames}
+
+    def default_scorecards(connection, envorder, appids):
+        queries["scorecard"] = appids
+        return {appid: main.ScoreCard(domain="GLOBAL", data=[{"appid": appid}]) for appid in appids}
+
+    monkeypatch.setattr(main, "reference_data", main.ReferenceData(StandInSource(), refresh_secs=60))
+    monkeypatch.setattr(main, "db_connect", nullcontext)
+    monkeypatch.setattr(main, "frequency_scorecards", frequency_scorecards)
+    monkeypatch.setattr(main, "lag_scorecards", lag_scorecards)
+    monkeypatch.setattr(main, "default_scorecards", default_scorecards)
+    return queries
+
+
+def test_one_query_per_mode(main, queries):
+    items = [
+        main.ScoreCardRequest(mode="frequency", appid="1"),
+        main.ScoreCardRequest(mode="lag", appname="App"),
+        main.ScoreCardRequest(appid="7"),
+        main.ScoreCardRequest(mode="frequency", appid="2"),
+        main.ScoreCardRequest(mode="lag", appname="App"),
+        main.ScoreCardRequest(mode="frequency", appid="3"),
+        main.ScoreCardRequest(appid="7"),
+    ]
+    results = main.fetch_scorecard_batch(items, "sql")
+
+    # Apps 1 and 2 share a parent, repeats are asked for once
+    assert queries == {"frequency": ([1, 3], "sql"), "lag": (["App"], "sql"), "scorecard": ["7"]}
+    assert [result.data[0] for result in results] == [["parent 1"], ["App"], {"appid": "7"}, ["parent 1"], ["App"], ["parent 3"], {"appid": "7"}]
+
+
+def test_modes_not_asked_for_are_not_queried(main, queries):
+    results = main.fetch_scorecard_batch([main.ScoreCardRequest(mode="lag", appname="App")])
+    assert list(queries) == ["lag"]
+    assert results[0].columns == ["Dev", "Prod"]
+
+
+def test_endpoint(main, queries):
+    from fastapi.testclient import TestClient  # pylint: disable=C0415
+
+    client = TestClient(main.app)
+    response = client.post("/msapi/scorecard/batch", json={"items": [{"mode": "frequency"}, {"appid": "7"}], "compute": "pandas"})
+    assert response.status_code == 200
+    assert response.json() == {
+        "results": [
+            {"domain": "", "columns": ["Environment"], "data": [["parent -1"]]},
+            {"domain": "GLOBAL", "columns": [], "data": [{"appid": "7"}]},
+        ]
+    }
+    assert queries["frequency"] == ([-1], "pandas")
+
+    assert client.post("/msapi/scorecard/batch", json={"items": [{"mode": "nope"}]}).status_code == 422
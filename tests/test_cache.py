@@ -0,0 +1,108 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+
+
+def cachekey(appid: str, appname: str = "App") -> tuple:
+    # (frequency, lag, environment, appname, appid, compute, format, version, view) as get_scorecard builds it
+    return (None, None, None, appname, appid, "pandas", "json", None, ())
+
+
+def test_shared_cache_prunes_on_a_threshold(main, tmp_path, monkeypatch):
+    cache = main.SharedScoreCardCache(str(tmp_path), maxsize=30, maxbytes=10**6, ttl=60, prune_secs=3600)
+    prunes = []
+    prune = cache._prune
+    monkeypatch.setattr(cache, "_prune", lambda: prunes.append(1) or prune())
+
+    for appid in range(40):
+        cache.put(cachekey(str(appid)), b"x" * 10)
+
+    # A tenth of maxsize, so every third write scans the directory
+    assert len(prunes) == 13
+    assert cache.stats().entries == 31
+    assert cache.evictions == 9
+    assert cache.get(cachekey("39")) == b"x" * 10
+
+
+def test_shared_cache_runs_off_the_event_loop(main, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "scorecard_cache", main.SharedScoreCardCache(str(tmp_path), maxsize=30, maxbytes=10**6, ttl=60))
+    assert asyncio.run(main.run_cache(lambda: threading.current_thread().name)).startswith("scorecard-cache")
+
+    monkeypatch.setattr(main, "scorecard_cache", main.ScoreCardCache(maxsize=30, maxbytes=10**6, ttl=60))
+    assert asyncio.run(main.run_cache(lambda: threading.current_thread().name)) == threading.current_thread().name
+
+
+def test_ttl(main, monkeypatch):
+    cache = main.ScoreCardCache(maxsize=10, maxbytes=1000, ttl=60)
+    cache.put(cachekey("1"), b"one")
+    assert cache.get(cachekey("1")) == b"one"
+
+    now = main.time.monotonic()
+    monkeypatch.setattr(main.time, "monotonic", lambda: now + 61)
+    assert cache.get(cachekey("1")) is None
+    stats = cache.stats()
+    assert (stats.entries, stats.bytes, stats.hits, stats.misses) == (0, 0, 1, 1)
+
+
+def test_least_recently_used_goes_first(main):
+    cache = main.ScoreCardCache(maxsize=2, maxbytes=1000, ttl=60)
+    cache.put(cachekey("1"), b"one")
+    cache.put(cachekey("2"), b"two")
+    cache.get(cachekey("1"))
+    cache.put(cachekey("3"), b"three")
+    assert list(cache.entries) == [cachekey("1"), cachekey("3")]
+    assert cache.stats().evictions == 1
+
+
+def test_byte_limit(main):
+    cache = main.ScoreCardCache(maxsize=10, maxbytes=10, ttl=60)
+    cache.put(cachekey("1"), b"x" * 6)
+    cache.put(cachekey("2"), b"x" * 6)
+    assert list(cache.entries) == [cachekey("2")]
+    # Larger than the whole cache, not kept at all
+    cache.put(cachekey("3"), b"x" * 11)
+    assert list(cache.entries) == [cachekey("2")]
+    assert cache.stats().bytes == 6
+
+
+def test_invalidate_by_appid_and_appname(main):
+    cache = main.ScoreCardCache(maxsize=10, maxbytes=1000, ttl=60)
+    for appid, appname in (("1", "A"), ("2", "A"), ("3", "B")):
+        cache.put(cachekey(appid, appname), b"x")
+    assert cache.invalidate(appid="1") == 1
+    assert cache.invalidate(appname="A") == 1
+    assert list(cache.entries) == [cachekey("3", "B")]
+    assert cache.invalidate() == 1
+    assert cache.stats().invalidated == 3
+
+
+def test_admin_endpoint(main, monkeypatch):
+    from fastapi.testclient import TestClient  # pylint: disable=C0415
+
+    cache = main.ScoreCardCache(maxsize=10, maxbytes=1000, ttl=60)
+    monkeypatch.setattr(main, "scorecard_cache", cache)
+    monkeypatch.setattr(main, "scorecard_versions", main.VersionCache(ttl=60, maxsize=10))
+    monkeypatch.setattr(main, "reference_data", main.ReferenceData(None, refresh_secs=60))
+    for appid, appname in (("1", "A"), ("2", "B")):
+        cache.put(cachekey(appid, appname), b"xx")
+    client = TestClient(main.app)
+
+    assert client.get("/msapi/scorecard/cache").json() == {"entries": 2, "bytes": 4, "hits": 0, "misses": 0, "evictions": 0, "invalidated": 0}
+    assert client.delete("/msapi/scorecard/cache", params={"appname": "B"}).json()["entries"] == 1
+    main.reference_data.loaded_at = 1.0
+    assert client.delete("/msapi/scorecard/cache").json()["invalidated"] == 2
+    # Everything includes the reference data
+    assert main.reference_data.loaded_at == 0.0
@@ -0,0 +1,84 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# compute=sql against compute=pandas on a real Postgres. Set SCORECARD_TEST_DB to a scratch database name on the
+# DB_HOST/DB_PORT/DB_USER/DB_PASS server to run them, it is (re)seeded with the benchmark data set. Skipped otherwise.
+
+import os
+
+import pytest
+
+DBNAME = os.getenv("SCORECARD_TEST_DB", "")
+
+pytestmark = pytest.mark.skipif(not DBNAME, reason="SCORECARD_TEST_DB is not set")
+
+
+@pytest.fixture(scope="module")
+def connection(main):
+    pytest.importorskip("psycopg2")
+    from sqlalchemy import create_engine  # pylint: disable=C0415
+
+    from benchmark import schema  # pylint: disable=C0415
+
+    host = os.getenv("DB_HOST", "localhost")
+    port = os.getenv("DB_PORT", "5432")
+    user = os.getenv("DB_USER", "postgres")
+    password = os.getenv("DB_PASS", "postgres")
+    # Several versions per application with repeat deployments, so DISTINCT ON has older rows per environment to drop
+    schema.seed(host, port, user, password, DBNAME, schema.Scale(apps=6, versions=4, components=5, envs=5, deployments=12))
+
+    engine = create_engine("postgresql+psycopg2://" + user + ":" + password + "@" + host + ":" + port + "/" + DBNAME)
+    with engine.connect() as conn:
+        yield conn
+    engine.dispose()
+
+
+def test_lag_sql_matches_pandas(main, connection):
+    appnames = [row[0] for row in connection.exec_driver_sql("select name from dm.dm_application where parentid is null order by id").fetchall()]
+    appnames.append("nope")
+
+    assert main.lag_scorecards(connection, [], appnames, "sql") == main.lag_scorecards(connection, [], appnames, "pandas")
+    envorder = [row[0] for row in connection.exec_driver_sql("select name from dm.dm_environment order by id desc").fetchall()]
+    assert main.lag_scorecards(connection, envorder, appnames, "sql") == main.lag_scorecards(connection, envorder, appnames, "pandas")
+
+
+def test_frequency_sql_matches_pandas(main, connection):
+    parentids = [row[0] for row in connection.exec_driver_sql("select distinct parentid from dm.dm_app_scorecard order by 1").fetchall()]
+    parentids.append(-1)
+
+    assert main.frequency_scorecards(connection, parentids, "sql") == main.frequency_scorecards(connection, parentids, "pandas")
+    window = main.month_window("2024-01", "2024-06")
+    assert main.frequency_scorecards(connection, parentids, "sql", window) == main.frequency_scorecards(connection, parentids, "pandas", window)
+
+    # A parent whose only deployment has no month
+    connection.exec_driver_sql("insert into dm.dm_app_scorecard values (-2, 'App;1', 'Env1', null)")
+    cards = main.frequency_scorecards(connection, [-2], "sql")
+    assert cards == main.frequency_scorecards(connection, [-2], "pandas")
+    assert cards[-2].columns == []
+    connection.rollback()
+
+
+def test_marks_follow_edits_in_place(main, connection):
+    appid, compid = connection.exec_driver_sql("select d.appid, min(d.compid) from dm.dm_applicationcomponent d, dm.dm_scorecard_nv a where a.id = d.compid group by d.appid order by 1 limit 1").one()
+    marks = [main.scorecard_marks(connection, [appid])[str(appid)]]
+
+    # Neither edit adds a row or a deployment, only the digest can tell
+    connection.exec_driver_sql("update dm.dm_scorecard_nv set value = value || 'x' where id = %s and name = 'SonarBugs'", (compid,))
+    marks.append(main.scorecard_marks(connection, [appid])[str(appid)])
+    connection.exec_driver_sql("update dm.dm_component set name = name || 'x' where id = %s", (compid,))
+    marks.append(main.scorecard_marks(connection, [appid])[str(appid)])
+    connection.rollback()
+
+    assert len(set(marks)) == 3
+    assert main.scorecard_marks(connection, [appid])[str(appid)] == marks[0]
@@ -0,0 +1,44 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def read_table(body: bytes, format: str):
+    if format == "parquet":
+        return pq.read_table(io.BytesIO(body))
+    return pa.ipc.open_stream(io.BytesIO(body)).read_all()
+
+
+@pytest.mark.parametrize("format", ["arrow", "parquet"])
+@pytest.mark.parametrize("label,counts", [("Environment", True), ("Application", False)])
+def test_empty_frequency_and_lag_export(main, format, label, counts):
+    # An app without deployments comes back with its label as the only column name
+    data = main.ScoreCard(columns=[label], data=[])
+    table = read_table(main.export_scorecard(data, format, label, counts), format)
+    assert table.column_names == [label]
+    assert table.num_rows == 0
+
+
+@pytest.mark.parametrize("format", ["arrow", "parquet"])
+def test_frequency_export(main, format):
+    data = main.ScoreCard(columns=["Jan 2024", "Feb 2024"], data=[["Env1", 1.0, 0.0], ["Env2", 0.0, 2.0]])
+    table = read_table(main.export_scorecard(data, format, "Environment", counts=True), format)
+    assert table.column_names == ["Environment", "Jan 2024", "Feb 2024"]
+    assert table.to_pylist() == [{"Environment": "Env1", "Jan 2024": 1, "Feb 2024": 0}, {"Environment": "Env2", "Jan 2024": 0, "Feb 2024": 2}]
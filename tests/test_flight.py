@@ -0,0 +1,69 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+
+import pytest
+
+
+def test_identical_calls_share_one_run(main):
+    flight = main.SingleFlight(enabled=True, timeout=5, coalesced=None)
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return b"card"
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do(("1",), work) for _ in range(3)))
+
+    assert asyncio.run(scenario()) == [b"card"] * 3
+    assert len(runs) == 1
+    assert flight.calls == {}
+
+
+def test_error_reaches_every_waiter(main):
+    flight = main.SingleFlight(enabled=True, timeout=5, coalesced=None)
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("no database")
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do(("1",), work) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+    assert [type(error) for error in errors] == [ValueError] * 3
+    # The key is free again, so the next request retries instead of getting the old error
+    assert flight.calls == {}
+
+
+def test_follower_times_out(main):
+    flight = main.SingleFlight(enabled=True, timeout=0.01, coalesced=None)
+
+    async def work():
+        await asyncio.sleep(0.1)
+        return b"card"
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do(("1",), work))
+        await asyncio.sleep(0)
+        with pytest.raises(main.HTTPException) as excinfo:
+            await flight.do(("1",), work)
+        # Shielded, the follower giving up does not cancel the work for the leader
+        return excinfo.value.status_code, await leader
+
+    assert asyncio.run(scenario()) == (504, b"card")
@@ -0,0 +1,68 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+NV_COLUMNS = ["reqid", "domainid", "appid", "compid", "application", "component", "name", "value"]
+
+
+class StubResult:
+    def fetchall(self):
+        return []
+
+
+class StubConnection:
+    def execute(self, *args, **kwargs):
+        return StubResult()
+
+
+@pytest.fixture
+def no_database(main, monkeypatch):
+    monkeypatch.setattr(main, "prepare", lambda connection, name, sqlstmt, types: sqlstmt)
+    monkeypatch.setattr(main, "read_sql", lambda sqlstmt, connection, params=None: pd.DataFrame(columns=NV_COLUMNS))
+    monkeypatch.setattr(main, "scorecard_envtable", lambda connection, envorder: pd.DataFrame(index=pd.Index([], name="appid")))
+    return StubConnection()
+
+
+@pytest.mark.parametrize("page", [None, (None, 10)])
+def test_default_scorecard_without_appid(main, no_database, page):
+    card = main.default_scorecards(no_database, [], [None], page=page)[None]
+    assert card.data == []
+    if page is not None:
+        assert card.next is None
+
+
+def test_page_cursor_round_trip(main):
+    cursor = main.encode_cursor("App;1", "Comp.1", 3, 14)
+    assert main.page_cursor(cursor, 5) == (("App;1", "Comp.1", 3, 14), 5)
+    assert main.page_cursor(None, 5) == (None, 5)
+    assert main.page_cursor(None, None) is None
+
+
+@pytest.mark.parametrize("cursor,limit", [("abc", 5), (None, 0), ("abc", None)])
+def test_page_cursor_rejects(main, cursor, limit):
+    with pytest.raises(HTTPException) as err:
+        main.page_cursor(cursor, limit)
+    assert err.value.status_code == 422
+
+
+def test_month_window(main):
+    assert main.month_window("2024-03", "2024-12") == (datetime(2024, 3, 1), datetime(2025, 1, 1))
+    assert main.month_window(None, "2024-06") == (None, datetime(2024, 7, 1))
+    with pytest.raises(HTTPException):
+        main.month_window("2024-13", None)
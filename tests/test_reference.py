@@ -0,0 +1,87 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import threading
+
+import pytest
+
+
+class StandInSource:
+    """
+    Local stand-in for PostgresReferenceSource, counting how often each set is loaded.
+    """
+
+    def __init__(self):
+        self.envorder = ["Dev", "QA", "Prod"]
+        self.parents = {"1": 1, "2": 1}
+        self.loads = 0
+        self.lookups: list[str] = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def load_env_order(self) -> list[str]:
+        self.gate.wait(5)
+        self.loads += 1
+        return list(self.envorder)
+
+    def load_parents(self) -> dict[str, int]:
+        return dict(self.parents)
+
+    def lookup_parent(self, appid: str) -> int:
+        self.lookups.append(appid)
+        return -1
+
+
+@pytest.fixture
+def source(main, monkeypatch):
+    source = StandInSource()
+    monkeypatch.setattr(main, "reference_data", main.ReferenceData(source, refresh_secs=60))
+    return source
+
+
+def test_loads_once(main, source):
+    assert main.reference_data.env_order() == ["Dev", "QA", "Prod"]
+    assert main.reference_data.parent_id("2") == 1
+    assert source.loads == 1
+
+
+def test_unknown_app_is_looked_up_once(main, source):
+    assert main.reference_data.parent_id("3") == -1
+    assert main.reference_data.parent_id("3") == -1
+    assert source.lookups == ["3"]
+
+
+def test_invalidate_reloads(main, source):
+    main.reference_data.env_order()
+    source.envorder = ["Prod"]
+    assert main.reference_data.env_order() == ["Dev", "QA", "Prod"]
+    main.reference_data.invalidate()
+    assert main.reference_data.env_order() == ["Prod"]
+    assert source.loads == 2
+
+
+def test_stale_data_is_served_while_refreshing(main, source, monkeypatch):
+    main.reference_data.env_order()
+    source.envorder = ["Prod"]
+    source.gate.clear()
+    now = main.time.monotonic()
+    monkeypatch.setattr(main.time, "monotonic", lambda: now + 61)
+
+    assert main.reference_data.env_order() == ["Dev", "QA", "Prod"]
+    source.gate.set()
+    for thread in threading.enumerate():
+        if thread.name == "scorecard-refdata":
+            thread.join(5)
+    assert main.reference_data.env_order() == ["Prod"]
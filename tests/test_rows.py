@@ -0,0 +1,247 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# The row builders against the itertuples() loops they replaced, kept here as the reference
+
+import random
+
+import pandas as pd
+import pytest
+
+SEEDS = [1, 2, 3, 4, 5]
+ENVIRONMENTS = ["Dev", "QA", "Stage", "Prod"]
+MONTHS = ["2023-11-01", "2023-12-01", "2024-01-01", "2024-02-01", "2024-03-01"]
+
+
+def reference_frequency_rows(df: pd.DataFrame) -> tuple[list, list]:
+    table = df.pivot_table(values=["frequency"], index=["application", "environment", "month"], columns=["month"])
+
+    table = table.fillna(0)
+    cols = list(table.columns)
+
+    cols.insert(0, "Environment")
+    cols.insert(0, "Application")
+
+    appmap: dict[tuple, dict] = {}
+    for i in table.itertuples():
+        row = i.Index
+        rowdict = {cols[0]: row[0], cols[1]: row[1]}
+        rowdict = appmap.get((row[0], row[1]), rowdict)
+
+        for col in cols[2::]:
+            val = getattr(i, "_" + str(cols.index(col) - 1), 0)
+            if rowdict.get(col[1], 0) == 0:
+                rowdict.update({col[1]: val})
+        appmap.update({(row[0], row[1]): rowdict})
+
+    rows = list(appmap.values())
+
+    cols = []
+    if len(rows) > 0:
+        cols = list(rows[0].keys())
+        cols.remove("Application")
+        cols.remove("Environment")
+        cols.sort()
+
+    datarows = [[row.get("Environment")] + [row.get(col, 0) for col in cols] for row in rows]
+    return cols, datarows
+
+
+def reference_lag_rows(table: pd.DataFrame) -> list:
+    datarows = []
+    for row in table.itertuples():
+        outrow = [row[k] for k in range(1, len(row))]
+        if sum(outrow[1:]) > 0:
+            datarows.append(outrow)
+    return datarows
+
+
+def reference_scorecard_rows(table: pd.DataFrame) -> tuple[list, list]:
+    cols = list(table.columns)
+    columns = [{"name": col.lower(), "data": col.lower()} for col in cols[3::]]
+
+    rows = []
+    for i in table.itertuples():
+        rowdict = {}
+        for col in cols[3::]:
+            val = None
+            if col:
+                val = getattr(i, col, None)
+            if val is None:
+                val = getattr(i, "_" + str(cols.index(col) - 1), "")
+
+            valstr = ""
+            if val is not None:
+                valstr = str(val)
+
+            if col.startswith("Env:") and len(valstr.strip()) > 0:
+                val = "Y"
+            rowdict.update({col.lower(): val})
+        rows.append(rowdict)
+    return columns, rows
+
+
+def random_frequency(rnd: random.Random) -> pd.DataFrame:
+    rows: list[tuple] = []
+    for version in range(1, rnd.randint(2, 4)):
+        application = "App;" + str(version)
+        for environment in rnd.sample(ENVIRONMENTS, rnd.randint(1, len(ENVIRONMENTS))):
+            for month in rnd.sample(MONTHS, rnd.randint(1, len(MONTHS))):
+                rows.append((1, application, environment, month, rnd.randint(1, 9)))
+            if rnd.random() < 0.2:
+                # Deployments without a month count as zero and drop out of the pivot
+                rows.append((1, application, environment, None, 0))
+    return pd.DataFrame(rows, columns=["parentid", "application", "environment", "month", "frequency"])
+
+
+class GridResult:
+    def __init__(self, rows: list):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class GridConnection:
+    """
+    Answers the compute=sql frequency query with the month maps Postgres would build from df.
+    """
+
+    def __init__(self, df: pd.DataFrame, rnd: random.Random):
+        grid: dict[tuple, dict] = {}
+        for row in df.itertuples():
+            counts = grid.setdefault((row.parentid, row.application, row.environment), {})
+            if row.month is not None:
+                counts[row.month] = row.frequency
+        # json_object_agg() ... filter (where month is not null) is null for a group without months
+        self.rows = [key + (counts or None,) for key, counts in grid.items()]
+        rnd.shuffle(self.rows)
+
+    def execute(self, *args, **kwargs):
+        return GridResult(self.rows)
+
+
+def random_components(rnd: random.Random) -> tuple[pd.DataFrame, pd.DataFrame]:
+    nvrows = []
+    envrows = []
+    compid = 100
+    for appid in range(1, rnd.randint(3, 5)):
+        application = "App;" + str(rnd.choice([1, 2, 9, 10, 11]))
+        for environment in rnd.sample(ENVIRONMENTS, rnd.randint(0, len(ENVIRONMENTS))):
+            envrows.append((appid, environment))
+        for _ in range(rnd.randint(1, 6)):
+            compid += 1
+            component = "Comp" + str(rnd.randint(1, 30))
+            values = {
+                "SonarBugs": str(rnd.randint(0, 20)),
+                "SonarCodeSmells": str(rnd.randint(0, 200)),
+                "SonarProjectStatus": rnd.choice(["OK", "ERROR"]),
+                "GitLinesAdded": str(rnd.randint(0, 2000)),
+                "GitLinesDeleted": str(rnd.randint(0, 500)),
+                "GitLinesTotal": str(rnd.choice([0, rnd.randint(1000, 90000)])),
+                "GitCommittersCnt": str(rnd.randint(0, 8)),
+                "GitTotalCommittersCnt": str(rnd.randint(0, 20)),
+                "JobTriggeredBy": rnd.choice(["SCM", "user"]),
+                "VeracodeScore": str(rnd.randint(0, 100)),
+                "license": "Y",
+                "readme": "Y",
+                "swagger": "Y",
+            }
+            # Each component misses some of them, so the defaults get filled in
+            for name in rnd.sample(sorted(values), rnd.randint(1, len(values))):
+                nvrows.append((1, appid, compid, application, component, name, values[name]))
+
+    df = pd.DataFrame(nvrows, columns=["domainid", "appid", "compid", "application", "component", "name", "value"])
+    envdf = pd.DataFrame(envrows, columns=["appid", "environment"])
+    envtable = envdf.pivot(index="appid", columns="environment", values="environment")
+    envtable = envtable.reindex(columns=[env for env in ENVIRONMENTS if env in envtable.columns])
+    envtable.columns = ["Env:_" + col for col in envtable.columns]
+    return df, envtable
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_frequency_rows(main, monkeypatch, seed):
+    df = random_frequency(random.Random(seed))
+    monkeypatch.setattr(main, "prepare", lambda connection, name, sqlstmt, types: sqlstmt)
+    monkeypatch.setattr(main, "read_sql", lambda sqlstmt, connection, params=None: df)
+
+    card = main.frequency_scorecards(None, [1], "pandas")[1]
+    cols, datarows = reference_frequency_rows(df)
+    assert card.columns == main.month_labels(cols)
+    assert card.data == datarows
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_frequency_grid_rows(main, seed):
+    df = random_frequency(random.Random(seed))
+    grid: dict[tuple, dict] = {}
+    for row in df.dropna(subset=["month"]).itertuples():
+        grid.setdefault((row.application, row.environment), {})[row.month] = row.frequency
+
+    months, datarows = main.frequency_grid_rows([(application, environment, counts) for (application, environment), counts in reversed(grid.items())])
+    assert (months, datarows) == reference_frequency_rows(df)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_lag_rows(main, seed):
+    rnd = random.Random(seed)
+    data = {"Application": ["App;" + str(version) for version in range(1, 8)]}
+    for environment in ENVIRONMENTS:
+        data[environment] = [rnd.choice([0.0, 0.0, round(rnd.uniform(0, 90), 2)]) for _ in data["Application"]]
+    table = pd.DataFrame(data)
+
+    assert main.lag_rows(table) == reference_lag_rows(table)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_scorecard_rows(main, seed):
+    df, envtable = random_components(random.Random(seed))
+    table = main.scorecard_table(df, envtable)
+
+    columns, rows = main.scorecard_rows(table)
+    refcolumns, refrows = reference_scorecard_rows(table)
+    assert columns == refcolumns
+    assert rows == refrows
+
+    _, sources = main.scorecard_columns(table)
+    names, values = main.scorecard_values(table, sources, 0, len(table.index))
+    assert [dict(zip(names, vals)) for vals in zip(*values)] == refrows
+
+
+def test_scorecard_rows_renamed_fields(main):
+    # Column names itertuples() cannot use as fields are looked up by position, as the reference does
+    table = pd.DataFrame([[1, 2, 3, "a", "b", "c", "d", "", "e"]], columns=["appid", "compid", "domainid", "Env:_Prod", "class", "_x", "Dup", "Dup", "2nd"])
+    assert main.scorecard_rows(table) == reference_scorecard_rows(table)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_frequency_grid_matches_pivot(main, monkeypatch, seed):
+    rnd = random.Random(seed)
+    df = pd.concat([random_frequency(rnd).assign(parentid=parentid) for parentid in (1, 2, 3)], ignore_index=True)
+    monkeypatch.setattr(main, "prepare", lambda connection, name, sqlstmt, types: sqlstmt)
+    monkeypatch.setattr(main, "read_sql", lambda sqlstmt, connection, params=None: df)
+
+    parentids = [1, 2, 3, 4]
+    assert main.frequency_scorecards(GridConnection(df, rnd), parentids, "sql") == main.frequency_scorecards(None, parentids, "pandas")
+
+
+def test_frequency_grid_matches_pivot_without_months(main, monkeypatch):
+    # Parent 1 only has a deployment without a month, parent 2 has nothing at all
+    df = pd.DataFrame([(1, "App;1", "Dev", None, 0)], columns=["parentid", "application", "environment", "month", "frequency"])
+    monkeypatch.setattr(main, "prepare", lambda connection, name, sqlstmt, types: sqlstmt)
+    monkeypatch.setattr(main, "read_sql", lambda sqlstmt, connection, params=None: df)
+
+    cards = main.frequency_scorecards(GridConnection(df, random.Random(1)), [1, 2], "sql")
+    assert cards == main.frequency_scorecards(None, [1, 2], "pandas")
+    assert cards[1].columns == [] and cards[2].columns == ["Environment"]
@@ -0,0 +1,71 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def store(main):
+    store = main.ScoreCardStore(enabled=True, refresh_secs=30, maxapps=3, maxbytes=100, idle_secs=60)
+    # Taken already, so track() starts no refresh worker and the tests drive the store directly
+    store.worker = threading.current_thread()
+    return store
+
+
+def test_least_recently_read_goes_first(main, store):
+    for appid in ("1", "2", "3"):
+        store.track(appid, main.ScoreCard(), 10)
+    assert store.get("1") is not None
+    store.track("4", main.ScoreCard(), 10)
+    assert list(store.entries) == ["3", "1", "4"]
+    assert store.nbytes == 30
+
+
+def test_byte_limit(main, store):
+    store.track("1", main.ScoreCard(), 60)
+    store.track("2", main.ScoreCard(), 60)
+    assert list(store.entries) == ["2"]
+    assert store.nbytes == 60
+    # Larger than the whole store, not kept at all
+    store.track("3", main.ScoreCard(), 101)
+    assert list(store.entries) == ["2"]
+
+
+def test_invalidate(main, store):
+    for appid in ("1", "2"):
+        store.track(appid, main.ScoreCard(), 10)
+    store.envmark = ("env",)
+    assert store.invalidate("1") == 1
+    assert list(store.entries) == ["2"]
+    assert store.invalidate() == 1
+    assert store.entries == {} and store.nbytes == 0 and store.envmark is None
+
+
+def test_idle_entries_are_dropped_not_refreshed(main, store, monkeypatch):
+    store.track("1", main.ScoreCard(), 10)
+    now = main.time.monotonic()
+    monkeypatch.setattr(main.time, "monotonic", lambda: now + 61)
+    # Nothing left to refresh, so the pass returns before connecting
+    monkeypatch.setattr(main, "db_connect", lambda: pytest.fail("connected"))
+    store.refresh()
+    assert store.entries == {}
+
+
+def test_mark_must_match(main, store):
+    store.track("1", main.ScoreCard(), 10)
+    store.envmark = ("env",)
+    assert store.get("1", (("env",), None)) is not None
+    assert store.get("1", (("env",), (1, 2, 3))) is None
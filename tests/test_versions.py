@@ -0,0 +1,60 @@
+# Copyright (c) 2021 Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+
+def counting_version(calls: list):
+    async def version():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ("default", len(calls))
+
+    return version
+
+
+def test_concurrent_lookups_share_one_query(main):
+    cache = main.VersionCache(ttl=60, maxsize=16)
+    calls = []
+
+    async def herd():
+        return await asyncio.gather(*[cache.get(("default", "1"), counting_version(calls)) for _ in range(20)])
+
+    assert asyncio.run(herd()) == [("default", 1)] * 20
+    assert len(calls) == 1
+    # Later requests within the TTL do not query at all
+    assert asyncio.run(cache.get(("default", "1"), counting_version(calls))) == ("default", 1)
+    assert len(calls) == 1
+
+
+def test_expiry_and_invalidate(main):
+    calls = []
+    cache = main.VersionCache(ttl=0, maxsize=16)
+    asyncio.run(cache.get(("default", "1"), counting_version(calls)))
+    asyncio.run(cache.get(("default", "1"), counting_version(calls)))
+    assert len(calls) == 2
+
+    cache = main.VersionCache(ttl=60, maxsize=16)
+    asyncio.run(cache.get(("default", "1"), counting_version(calls)))
+    cache.invalidate()
+    asyncio.run(cache.get(("default", "1"), counting_version(calls)))
+    assert len(calls) == 4
+
+
+def test_size_limit(main):
+    calls = []
+    cache = main.VersionCache(ttl=60, maxsize=2)
+    for appid in ("1", "2", "3"):
+        asyncio.run(cache.get(("default", appid), counting_version(calls)))
+    assert list(cache.entries) == [("default", "2"), ("default", "3")]